@@ -0,0 +1,117 @@
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import List, Optional
+import httpx
+import ollama
+
+# Errors after which a request is retried on another backend
+FAILOVER_ERRORS = (asyncio.TimeoutError, ConnectionError, httpx.TransportError)
+
+
+class Backend:
+    """One Ollama server and what the pool knows about it"""
+
+    def __init__(self, host: str, capacity: int, request_timeout: float):
+        self.host = host
+        self.capacity = capacity
+        self.client = ollama.AsyncClient(host=host, timeout=request_timeout)
+        self.in_flight = 0
+        self.healthy = True
+        self.loaded_models: List[str] = []
+        self.last_error: Optional[str] = None
+        self.checked_at: Optional[float] = None
+        self.cooldown_until = 0.0
+
+    def load(self) -> float:
+        return self.in_flight / self.capacity
+
+    def status(self) -> dict:
+        return {
+            "host": self.host,
+            "healthy": self.healthy,
+            "in_flight": self.in_flight,
+            "capacity": self.capacity,
+            "loaded_models": self.loaded_models,
+            "last_error": self.last_error,
+        }
+
+
+class BackendPool:
+    """Routes each request to the least-loaded healthy Ollama server.
+
+    A background task polls every backend for health and loaded models. A backend that
+    fails or times out on a request is marked unhealthy, and stays out of rotation for
+    `failure_cooldown` seconds even if it still answers health checks.
+    """
+
+    def __init__(self, hosts: List[str], model: str, capacity_per_backend: int = 1,
+                 health_interval: float = 10, health_timeout: float = 3, request_timeout: float = 300,
+                 failure_cooldown: float = 30):
+        if not hosts:
+            raise ValueError("At least one Ollama host is required")
+        self.model = model
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.failure_cooldown = failure_cooldown
+        self.backends = [Backend(host, capacity_per_backend, request_timeout) for host in hosts]
+        self._health_task = None
+
+    @property
+    def capacity(self) -> int:
+        return sum(backend.capacity for backend in self.backends)
+
+    def pick(self, exclude=()) -> Optional[Backend]:
+        """Least-loaded healthy backend, preferring ones that already have the model loaded"""
+        candidates = [b for b in self.backends if b not in exclude]
+        healthy = [b for b in candidates if b.healthy]
+        # With no healthy backend left, the health data may be stale; try the others anyway
+        candidates = healthy or candidates
+        if not candidates:
+            return None
+        random.shuffle(candidates)  # spread ties
+        return min(candidates, key=lambda b: (b.load(), self.model not in b.loaded_models))
+
+    @asynccontextmanager
+    async def use(self, backend: Backend):
+        self.ensure_health_checks()
+        backend.in_flight += 1
+        try:
+            yield backend
+        finally:
+            backend.in_flight -= 1
+
+    def mark_failed(self, backend: Backend, error: Exception):
+        backend.healthy = False
+        backend.last_error = str(error) or type(error).__name__
+        backend.cooldown_until = time.monotonic() + self.failure_cooldown
+        print(f"Ollama backend {backend.host} failed: {backend.last_error}")
+
+    async def check(self, backend: Backend):
+        try:
+            response = await asyncio.wait_for(backend.client.ps(), timeout=self.health_timeout)
+            backend.loaded_models = [model.model for model in response.models]
+            if time.monotonic() >= backend.cooldown_until:
+                backend.healthy = True
+                backend.last_error = None
+        except Exception as e:
+            backend.healthy = False
+            backend.last_error = str(e) or type(e).__name__
+        backend.checked_at = time.time()
+
+    async def check_all(self):
+        await asyncio.gather(*(self.check(backend) for backend in self.backends))
+
+    def ensure_health_checks(self):
+        """Start the background health checks on the running event loop, once"""
+        if self._health_task is None or self._health_task.done():
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def _health_loop(self):
+        while True:
+            await self.check_all()
+            await asyncio.sleep(self.health_interval)
+
+    def status(self) -> List[dict]:
+        return [backend.status() for backend in self.backends]
@@ -0,0 +1,130 @@
+"""Benchmark process_message end to end against the local stand-in Ollama and Serper servers.
+
+Needs no model and no Serper key. Each question goes through the full pipeline (prompt
+building, streaming, call detection, search, follow-up call) and the report shows end-to-end
+and per-stage latency separately for questions answered directly and those that searched.
+The model and search caches are off so every question does the full work.
+
+    python bench_pipeline.py --requests 100 --concurrency 10 --tokens-per-second 40
+    python bench_pipeline.py --questions questions.jsonl --native-tools
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+
+from stub_servers import load_script, serve_ollama, serve_serper, start_in_process
+
+# Half of them match the default script and search
+QUESTIONS = [
+    "What is the boiling point of water at sea level?",
+    "Who is the current world chess champion?",
+    "Explain how photosynthesis works.",
+    "What are the latest developments in fusion energy?",
+    "Who wrote Pride and Prejudice?",
+    "Who won the 2025 Champions League final?",
+    "What is the capital of Australia?",
+    "What is the weather like today in Paris?",
+]
+
+STAGES = ["ttft", "model_1", "tools_1", "model_2", "total"]
+
+
+def read_questions(path: str) -> list:
+    with open(path) as f:
+        items = [json.loads(line) for line in f if line.strip()]
+    return [item if isinstance(item, str) else item["question"] for item in items]
+
+
+def percentile(values: list, fraction: float) -> float:
+    values = sorted(values)
+    return values[max(int(len(values) * fraction + 0.5) - 1, 0)]
+
+
+def report(name: str, traces: list):
+    print(f"\n{name}: {len(traces)} questions")
+    if not traces:
+        return
+    print(f"  {'stage':<8} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}")
+    for stage in STAGES:
+        values = [trace["timings"][stage] for trace in traces if stage in trace["timings"]]
+        if values:
+            print(f"  {stage:<8} {statistics.median(values) * 1000:9.1f} "
+                  f"{percentile(values, 0.95) * 1000:9.1f} {max(values) * 1000:9.1f}")
+
+
+async def run(questions: list, concurrency: int) -> tuple:
+    import processing
+    from search_function import close_async_client
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(question):
+        trace = {}
+        async with semaphore:
+            async for _ in processing.process_message(question, [], trace=trace):
+                pass
+        return trace
+
+    # One warm-up question so connection setup and the capability check are not measured
+    await one(questions[0])
+    started = time.perf_counter()
+    traces = await asyncio.gather(*(one(q) for q in questions))
+    elapsed = time.perf_counter() - started
+    await close_async_client()
+    return traces, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", help="JSONL file of questions (strings or objects with a question)")
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--tokens-per-second", type=float, default=40)
+    parser.add_argument("--ttft-ms", type=float, default=150)
+    parser.add_argument("--answer-tokens", type=int, default=60)
+    parser.add_argument("--search-latency-ms", type=float, default=300)
+    parser.add_argument("--page-latency-ms", type=float, default=100)
+    parser.add_argument("--native-tools", action="store_true", help="Stand-in model takes Ollama's tools parameter")
+    parser.add_argument("--script", help="JSON file of function call rules for the stand-in model")
+    parser.add_argument("--no-speculation", action="store_true", help="Turn the speculative search off")
+    args = parser.parse_args()
+
+    ollama_server, ollama_port = start_in_process(
+        serve_ollama, args.tokens_per_second, args.ttft_ms / 1000, args.answer_tokens,
+        args.native_tools, load_script(args.script)
+    )
+    serper_server, serper_port = start_in_process(
+        serve_serper, args.search_latency_ms / 1000, 0, 5, args.page_latency_ms / 1000
+    )
+
+    # processing and search_function read these at import time
+    os.environ["OLLAMA_HOSTS"] = f"http://127.0.0.1:{ollama_port}"
+    os.environ["OLLAMA_BACKEND_CONCURRENCY"] = str(args.concurrency)
+    os.environ["SERPER_URL"] = f"http://127.0.0.1:{serper_port}/search"
+    os.environ.setdefault("SERPER_API_KEY", "benchmark")
+    os.environ["LLM_CACHE"] = "0"
+    os.environ["SEARCH_CACHE_TTL"] = "0"
+    os.environ["SEARCH_PAGE_CACHE_TTL"] = "0"
+    os.environ["SPECULATIVE_SEARCH"] = "0" if args.no_speculation else "1"
+
+    questions = read_questions(args.questions) if args.questions else QUESTIONS
+    questions = (questions * (args.requests // len(questions) + 1))[:args.requests]
+    traces, elapsed = asyncio.run(run(questions, args.concurrency))
+
+    errors = [trace["error"] for trace in traces if trace["error"]]
+    print(f"{len(traces)} questions in {elapsed:.2f}s ({len(traces) / elapsed:.1f}/s), "
+          f"concurrency {args.concurrency}, {len(errors)} errors")
+    for error in sorted(set(errors)):
+        print(f"  error: {error}")
+    report("direct answers", [trace for trace in traces if not trace["searched"] and not trace["error"]])
+    report("search answers", [trace for trace in traces if trace["searched"] and not trace["error"]])
+
+    ollama_server.terminate()
+    serper_server.terminate()
+
+
+if __name__ == "__main__":
+    main()
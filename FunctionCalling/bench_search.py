@@ -0,0 +1,81 @@
+"""Benchmark the Serper transports against a local stand-in server.
+
+Compares a bare requests.post per call (the old behaviour), the pooled sync session and
+the pooled async client. The cache is bypassed so every call hits the server. Loopback has
+no TLS, so --connect-ms adds a delay to every new connection to stand in for the TCP+TLS
+handshake that keep-alive saves over a real network.
+
+    python bench_search.py --requests 200 --concurrency 20 --latency-ms 50 --connect-ms 60
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from stub_servers import serve_serper, start_in_process
+
+
+def report(name: str, total: float, latencies: list):
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{name:<22} total {total:7.3f}s  {len(latencies) / total:8.1f} req/s  "
+          f"p50 {statistics.median(latencies) * 1000:7.1f}ms  p95 {p95 * 1000:7.1f}ms")
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--connect-ms", type=float, default=60)
+    args = parser.parse_args()
+
+    server, port = start_in_process(serve_serper, args.latency_ms / 1000, args.connect_ms / 1000, 1, 0)
+    os.environ["SERPER_URL"] = f"http://127.0.0.1:{port}/search"
+    os.environ.setdefault("SERPER_API_KEY", "benchmark")
+
+    # Imported after the environment points at the stand-in server
+    import search_function
+
+    queries = [f"query {i}" for i in range(args.requests)]
+
+    def bare_post(query):
+        requests.post(search_function.SERPER_URL, headers=search_function._headers(), data=json.dumps({"q": query})).json()
+
+    for name, fn in (("bare requests.post", bare_post), ("pooled session", search_function.fetch_search_result)):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            latencies = list(pool.map(lambda q: timed(fn, q), queries))
+        report(name, time.perf_counter() - started, latencies)
+
+    async def run_async():
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def one(query):
+            async with semaphore:
+                started = time.perf_counter()
+                await search_function.fetch_search_result_async(query)
+                return time.perf_counter() - started
+
+        started = time.perf_counter()
+        latencies = await asyncio.gather(*(one(q) for q in queries))
+        report("pooled async client", time.perf_counter() - started, latencies)
+        await search_function.close_async_client()
+
+    asyncio.run(run_async())
+    server.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Measure time to first token with and without the session manager.
+
+Runs the same multi-turn conversation through process_message twice against the
+configured Ollama server, or with --stub the local stand-in, which models the model load
+time and prompt evaluation with KV cache reuse:
+  baseline  model unloaded after every call (keep_alive=0), no history, no preload
+  session   model preloaded and pinned, history included after the stable system prefix
+The response cache is bypassed so every turn reaches the model.
+
+    python bench_ttft.py --turns 5
+    python bench_ttft.py --stub --load-ms 3000 --prompt-tokens-per-second 400
+"""
+import argparse
+import asyncio
+import os
+import statistics
+
+QUESTIONS = [
+    "What is the boiling point of water at sea level?",
+    "And at the top of Mount Everest?",
+    "Why is it different?",
+    "What does that mean for cooking pasta?",
+    "Summarise the conversation in one sentence.",
+]
+
+
+async def run_conversation(turns: int) -> list:
+    import processing
+
+    processing.session.ttfts.clear()
+    chat_history = []
+    for question in (QUESTIONS * turns)[:turns]:
+        async for chat_history in processing.process_message(question, chat_history, use_cache=False):
+            pass
+    return list(processing.session.ttfts)
+
+
+def report(name: str, ttfts: list):
+    formatted = ", ".join(f"{t * 1000:.0f}" for t in ttfts)
+    print(f"{name:<9} p50 {statistics.median(ttfts) * 1000:8.1f}ms  first {ttfts[0] * 1000:8.1f}ms  [{formatted}]")
+
+
+async def run_both(turns: int):
+    import processing
+
+    # One event loop for both runs, the Ollama client's connections are bound to it
+    keep_alive, budget = processing.session.keep_alive, processing.session.history_token_budget
+    processing.session.keep_alive, processing.session.history_token_budget = 0, 0
+    report("baseline", await run_conversation(turns))
+
+    processing.session.keep_alive, processing.session.history_token_budget = keep_alive, budget
+    await asyncio.to_thread(processing.preload_model)
+    report("session", await run_conversation(turns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--stub", action="store_true", help="Measure against the local stand-in Ollama server")
+    parser.add_argument("--load-ms", type=float, default=3000, help="Stand-in model load time")
+    parser.add_argument("--prompt-tokens-per-second", type=float, default=400, help="Stand-in prompt evaluation rate")
+    parser.add_argument("--ttft-ms", type=float, default=50, help="Stand-in delay before the first token")
+    args = parser.parse_args()
+
+    stub = None
+    if args.stub:
+        from stub_servers import load_script, serve_ollama, start_in_process
+
+        stub, port = start_in_process(
+            serve_ollama, 40, args.ttft_ms / 1000, 20, False, load_script(None),
+            args.load_ms / 1000, args.prompt_tokens_per_second
+        )
+        # processing reads this at import time
+        os.environ["OLLAMA_HOSTS"] = f"http://127.0.0.1:{port}"
+
+    # Only the model is measured here, keep searches out of the way
+    os.environ["SPECULATIVE_SEARCH"] = "0"
+    asyncio.run(run_both(args.turns))
+    if stub is not None:
+        stub.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Optional
+
+
+class TTLCache:
+    """In-memory LRU cache with a time-to-live and an optional SQLite tier that survives restarts.
+
+    Values must be JSON serialisable when a `path` is given. Concurrent `get_or_compute`
+    calls for the same key share a single computation.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 600, path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._in_flight = {}  # key -> Future
+        self._async_in_flight = {}  # key -> asyncio.Task
+        self._lock = threading.Lock()
+        # SQLite work has its own lock, so a commit in a worker thread never holds up memory lookups
+        self._db_lock = threading.Lock()
+        self._db = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.shared = 0
+
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, expires_at REAL, value TEXT)"
+            )
+            self._db.commit()
+
+    def _get_disk(self, key: str):
+        row = self._db.execute("SELECT expires_at, value FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if row[0] < time.time():
+            self._db.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self._db.commit()
+            return None
+        return row[0], json.loads(row[1])
+
+    def _get_memory(self, key: str) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] >= time.time():
+                    self._entries.move_to_end(key)
+                    return entry[1]
+                del self._entries[key]
+            return None
+
+    def _get_disk_to_memory(self, key: str) -> Any:
+        if self._db is None:
+            return None
+        with self._db_lock:
+            entry = self._get_disk(key)
+        if entry is None:
+            return None
+        with self._lock:
+            # A set may have stored a newer value while the disk was read
+            current = self._entries.get(key)
+            if current is None or current[0] < entry[0]:
+                self._store_memory(key, *entry)
+        return entry[1]
+
+    def _count(self, outcome: str):
+        """Count one lookup as a "hit", "disk_hit" or "miss\""""
+        with self._lock:
+            if outcome == "miss":
+                self.misses += 1
+            else:
+                self.hits += 1
+                if outcome == "disk_hit":
+                    self.disk_hits += 1
+
+    def _lookup(self, key: str):
+        """The cached value and where it came from, without counting"""
+        value = self._get_memory(key)
+        if value is not None:
+            return value, "hit"
+        value = self._get_disk_to_memory(key)
+        return value, "disk_hit" if value is not None else "miss"
+
+    async def _alookup(self, key: str):
+        value = self._get_memory(key)
+        if value is not None or self._db is None:
+            return value, "hit" if value is not None else "miss"
+        value = await asyncio.to_thread(self._get_disk_to_memory, key)
+        return value, "disk_hit" if value is not None else "miss"
+
+    def get(self, key: str) -> Any:
+        """Return the cached value or None if missing or expired"""
+        value, outcome = self._lookup(key)
+        self._count(outcome)
+        return value
+
+    async def aget(self, key: str) -> Any:
+        """Async get; only a lookup that reaches the SQLite tier leaves the event loop"""
+        value, outcome = await self._alookup(key)
+        self._count(outcome)
+        return value
+
+    def _store_memory(self, key: str, expires_at: float, value: Any):
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._store_memory(key, expires_at, value)
+        self._set_disk(key, expires_at, value)
+
+    def _set_disk(self, key: str, expires_at: float, value: Any):
+        if self._db is None:
+            return
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO cache (key, expires_at, value) VALUES (?, ?, ?)",
+                (key, expires_at, json.dumps(value)),
+            )
+            self._db.commit()
+
+    async def aset(self, key: str, value: Any, ttl: Optional[float] = None):
+        """Async set; the SQLite write runs in a thread"""
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._store_memory(key, expires_at, value)
+        if self._db is not None:
+            await asyncio.to_thread(self._set_disk, key, expires_at, value)
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any]) -> Any:
+        """Return the cached value, or compute it once even if several threads ask at the same time"""
+        value, outcome = self._lookup(key)
+        if value is not None:
+            self._count(outcome)
+            return value
+
+        with self._lock:
+            # The value may have landed between the lookup above and taking the lock
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] >= time.time():
+                self.hits += 1
+                return entry[1]
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                self.misses += 1
+                future = self._in_flight[key] = Future()
+            else:
+                # Joins a computation already under way: neither a hit nor a computation of its own
+                self.shared += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            value = compute()
+            self.set(key, value)
+            future.set_result(value)
+            return value
+        except Exception as e:
+            # Errors are handed to the waiters but never cached
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    async def aget_or_compute(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Async counterpart of get_or_compute; concurrent coroutines await one shared task"""
+        value, outcome = await self._alookup(key)
+        if value is not None:
+            self._count(outcome)
+            return value
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] >= time.time():
+                self.hits += 1
+                return entry[1]
+            task = self._async_in_flight.get(key)
+            if task is None:
+                self.misses += 1
+                task = self._async_in_flight[key] = asyncio.ensure_future(self._acompute(key, compute))
+                # Every caller may have given up by the time it fails; mark the exception as seen
+                task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            else:
+                self.shared += 1
+
+        # Shield the shared task so one cancelled caller does not cancel it for the others
+        return await asyncio.shield(task)
+
+    async def _acompute(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            value = await compute()
+            await self.aset(key, value)
+            return value
+        finally:
+            with self._lock:
+                self._async_in_flight.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            # Callers that shared an in-flight computation are left out of the hit rate
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "shared_in_flight": self.shared,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
@@ -17,9 +17,29 @@ class searchResult(BaseModel):
 
     def to_string(self) -> str:
         return f"Title: {self.title}\nLink: {self.link}\nSnippet: {self.snippet}"
-    
+
+
+class searchPassage(BaseModel):
+    source: int = Field(..., description="Index of the search result the passage comes from.")
+    text: str = Field(..., description="The passage text.")
+    score: float = Field(..., description="Lexical relevance to the query.")
+
+
+class searchResults(BaseModel):
+    query: str = Field(..., description="The search query.")
+    results: List[searchResult] = Field(..., description="The top search results.")
+    passages: List[searchPassage] = Field(default_factory=list, description="The most relevant passages of the result pages.")
+
+    def to_string(self) -> str:
+        sources = "\n\n".join(f"[{i + 1}] {result.to_string()}" for i, result in enumerate(self.results))
+        if not self.passages:
+            return sources
+        passages = "\n\n".join(f"[{passage.source + 1}] {passage.text}" for passage in self.passages)
+        return f"{sources}\n\nRelevant passages:\n{passages}"
+
+
 class functionCalling(BaseModel):
-    function_name: str = Field(..., description="The name of the function to call.")
+    name: str = Field(..., description="The name of the function to call.")
     parameters: Dict[str, Any] = Field(..., description="The parameters to pass to the function.")
 
 
@@ -0,0 +1,125 @@
+"""Run process_message without the Gradio UI.
+
+    python headless.py batch questions.jsonl answers.jsonl --workers 8
+    python headless.py serve --port 8000
+
+Batch input lines are either JSON strings or objects with a "question" and an optional
+"id"; each output line holds the answer, whether the model searched, the search queries
+and per-stage timings. Output lines are written as questions finish, so their order may
+differ from the input.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from typing import List, Optional
+from fastapi import FastAPI
+from pydantic import BaseModel
+from processing import process_message, session
+from search_function import close_async_client
+
+
+async def answer_question(question: str, history: Optional[list] = None, use_cache: bool = True) -> dict:
+    """Run one question through the full pipeline and return the answer with its trace"""
+    chat_history = list(history or [])
+    trace = {}
+    async for _ in process_message(question, chat_history, use_cache=use_cache, trace=trace):
+        pass
+    return {
+        "question": question,
+        "answer": trace["answer"],
+        "searched": trace["searched"],
+        "search_queries": [
+            call["parameters"].get("query") for call in trace["tool_calls"] if call["name"] == "google_search"
+        ],
+        "tool_calls": trace["tool_calls"],
+        "timings": trace["timings"],
+        "error": trace["error"],
+    }
+
+
+app = FastAPI()
+
+
+class Question(BaseModel):
+    question: str
+    history: List[dict] = []
+    use_cache: bool = True
+
+
+@app.post("/ask")
+async def ask(body: Question):
+    return await answer_question(body.question, body.history, body.use_cache)
+
+
+@app.get("/stats")
+async def stats():
+    return {"ollama": session.stats(), "backends": session.pool.status()}
+
+
+def read_questions(path: str) -> List[dict]:
+    questions = []
+    with open(path) as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if isinstance(item, str):
+                item = {"question": item}
+            item.setdefault("id", line_number)
+            questions.append(item)
+    return questions
+
+
+async def run_batch(input_path: str, output_path: str, workers: int, use_cache: bool = True):
+    questions = read_questions(input_path)
+    semaphore = asyncio.Semaphore(workers)
+    latencies = []
+    errors = 0
+
+    async def run_one(item, out):
+        nonlocal errors
+        async with semaphore:
+            result = await answer_question(item["question"], use_cache=use_cache)
+        result = {"id": item["id"], **result}
+        latencies.append(result["timings"]["total"])
+        errors += result["error"] is not None
+        out.write(json.dumps(result) + "\n")
+        out.flush()
+
+    started = time.perf_counter()
+    with open(output_path, "w") as out:
+        await asyncio.gather(*(run_one(item, out) for item in questions))
+    elapsed = time.perf_counter() - started
+    await close_async_client()
+
+    if latencies:
+        print(f"{len(latencies)} questions in {elapsed:.1f}s ({len(latencies) / elapsed:.2f}/s) with {workers} workers, "
+              f"{errors} errors, p50 {statistics.median(latencies):.2f}s, max {max(latencies):.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    batch = commands.add_parser("batch", help="Answer a JSONL file of questions")
+    batch.add_argument("input")
+    batch.add_argument("output")
+    batch.add_argument("--workers", type=int, default=4)
+    batch.add_argument("--no-cache", action="store_true", help="Bypass the model response cache")
+
+    serve = commands.add_parser("serve", help="Serve POST /ask")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8000)
+
+    args = parser.parse_args()
+    if args.command == "batch":
+        asyncio.run(run_batch(args.input, args.output, args.workers, use_cache=not args.no_cache))
+    else:
+        import uvicorn
+        uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
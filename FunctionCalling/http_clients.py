@@ -0,0 +1,32 @@
+import asyncio
+from typing import Callable, Dict
+import httpx
+
+
+class LoopClient:
+    """One keep-alive httpx.AsyncClient per event loop.
+
+    Async clients are bound to the loop they were created on, so a loop gets a client of
+    its own instead of replacing (and leaking) the client of another loop. Call `aclose()`
+    before a loop ends; closing needs the loop, so the client of a loop that has already
+    been closed can only be dropped.
+    """
+
+    def __init__(self, factory: Callable[[], httpx.AsyncClient]):
+        self.factory = factory
+        self._clients: Dict[asyncio.AbstractEventLoop, httpx.AsyncClient] = {}
+
+    def get(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        for closed in [other for other in self._clients if other.is_closed()]:
+            del self._clients[closed]
+        client = self._clients.get(loop)
+        if client is None or client.is_closed:
+            client = self._clients[loop] = self.factory()
+        return client
+
+    async def aclose(self):
+        """Close the running loop's client"""
+        client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
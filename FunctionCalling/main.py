@@ -6,7 +6,7 @@ import os
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field
 from typing import Optional, Dict, Any, List
-from processing import parse_function_call, google_search, process_message
+from processing import parse_function_call, google_search, process_message, preload_model, pool
 
 
 # Create Gradio Interface
@@ -36,17 +36,21 @@ with gr.Blocks(css="footer {visibility: hidden}") as demo:
         clear_btn = gr.Button("Clear Chat")
     
 
-    # Set up event handlers
+    # Set up event handlers; both share one queue sized to what the Ollama backends can serve
     msg.submit(
         process_message,
         [msg, chatbot],
         [chatbot],
+        concurrency_limit=pool.capacity,
+        concurrency_id="chat",
     )
     
     submit_btn.click(
         process_message,
         [msg, chatbot],
         [chatbot],
+        concurrency_limit=pool.capacity,
+        concurrency_id="chat",
     )
     
     clear_btn.click(
@@ -61,4 +65,5 @@ with gr.Blocks(css="footer {visibility: hidden}") as demo:
     submit_btn.click(lambda: "", None, msg)
 
 if __name__ == "__main__":
+    preload_model()
     demo.launch(inbrowser=True, share=True) 
\ No newline at end of file
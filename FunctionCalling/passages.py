@@ -0,0 +1,175 @@
+import asyncio
+import html
+import math
+import os
+import re
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+import httpx
+from cache import TTLCache
+from data_models import searchPassage, searchResult, searchResults
+from http_clients import LoopClient
+from tokens import estimate_tokens
+
+# Result pages are read up to this many bytes, and each fetch gets at most PAGE_TIMEOUT seconds
+PAGE_MAX_BYTES = int(os.getenv('SEARCH_PAGE_MAX_BYTES', '300000'))
+PAGE_TIMEOUT = float(os.getenv('SEARCH_PAGE_TIMEOUT', '2'))
+
+# Token budget for the passages handed to the follow-up model call
+CONTEXT_TOKENS = int(os.getenv('SEARCH_CONTEXT_TOKENS', '800'))
+
+# Passages are windows of PASSAGE_WORDS words, overlapping by half
+PASSAGE_WORDS = 60
+
+# Extracted page text is shared between searches; SEARCH_PAGE_CACHE_PATH keeps it across restarts
+page_cache = TTLCache(
+    max_entries=int(os.getenv('SEARCH_PAGE_CACHE_SIZE', '256')),
+    ttl=float(os.getenv('SEARCH_PAGE_CACHE_TTL', '3600')),
+    path=os.getenv('SEARCH_PAGE_CACHE_PATH')
+)
+
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have how in is it of on or that the this to was were "
+    "what when where which who why will with".split()
+)
+
+_DROP = re.compile(r"<(script|style|noscript|svg|head)\b.*?</\1\s*>|<!--.*?-->", re.IGNORECASE | re.DOTALL)
+_BLOCK = re.compile(r"<(?:/?(?:p|div|br|li|h[1-6]|tr|section|article)\b)[^>]*>", re.IGNORECASE)
+_TAG = re.compile(r"<[^>]+>")
+
+
+def html_to_text(page: str) -> str:
+    """Visible text of an HTML page, one block per line"""
+    page = _DROP.sub(" ", page)
+    page = _BLOCK.sub("\n", page)
+    page = html.unescape(_TAG.sub(" ", page))
+    lines = (re.sub(r"[ \t\r\f\v]+", " ", line).strip() for line in page.split("\n"))
+    return "\n".join(line for line in lines if line)
+
+
+def tokenize(text: str) -> List[str]:
+    return [word for word in re.findall(r"\w+", text.lower()) if word not in STOPWORDS]
+
+
+# Keep-alive client for result pages, one per event loop
+_page_client = LoopClient(lambda: httpx.AsyncClient(
+    follow_redirects=True,
+    headers={"User-Agent": "Mozilla/5.0 (compatible; FunctionCallingDemo/1.0)"},
+    limits=httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=30),
+    timeout=httpx.Timeout(PAGE_TIMEOUT)
+))
+
+
+def get_page_client() -> httpx.AsyncClient:
+    return _page_client.get()
+
+
+async def close_page_client():
+    await _page_client.aclose()
+
+
+async def _download_text(url: str) -> str:
+    async with get_page_client().stream("GET", url) as response:
+        response.raise_for_status()
+        content_type = response.headers.get("content-type", "")
+        if content_type and not content_type.startswith(("text/html", "text/plain", "application/xhtml")):
+            return ""
+        body = b""
+        async for chunk in response.aiter_bytes():
+            body += chunk
+            if len(body) >= PAGE_MAX_BYTES:
+                break
+    text = body[:PAGE_MAX_BYTES].decode(response.encoding or "utf-8", errors="ignore")
+    return text if content_type.startswith("text/plain") else html_to_text(text)
+
+
+async def fetch_page_text(url: str) -> str:
+    """Text of a result page, from the page cache when possible"""
+    # The cache shields the download from its callers, so it is bounded here as well
+    return await page_cache.aget_or_compute(url, lambda: asyncio.wait_for(_download_text(url), PAGE_TIMEOUT))
+
+
+async def fetch_pages(urls: List[str], timeout: float) -> Dict[str, str]:
+    """Fetch pages concurrently; pages that fail or miss the deadline are left out"""
+    if timeout <= 0 or not urls:
+        return {}
+    tasks = {asyncio.create_task(fetch_page_text(url)): url for url in urls}
+    done, pending = await asyncio.wait(tasks, timeout=timeout)
+    for task in pending:
+        task.cancel()
+    texts = {}
+    for task in done:
+        if task.exception() is not None:
+            print(f"Could not fetch {tasks[task]}: {str(task.exception()) or type(task.exception()).__name__}")
+        elif task.result():
+            texts[tasks[task]] = task.result()
+    return texts
+
+
+def split_passages(text: str, words: int = PASSAGE_WORDS) -> List[str]:
+    tokens = text.split()
+    step = max(words // 2, 1)
+    if not tokens:
+        return []
+    return [" ".join(tokens[i:i + words]) for i in range(0, max(len(tokens) - step, 1), step)]
+
+
+def rank_passages(query: str, passages: List[searchPassage]) -> List[searchPassage]:
+    """Score passages against the query with BM25, best first; passages sharing no term are dropped"""
+    terms = set(tokenize(query))
+    if not terms or not passages:
+        return []
+    docs = [Counter(tokenize(passage.text)) for passage in passages]
+    average_length = sum(sum(doc.values()) for doc in docs) / len(docs) or 1
+    document_frequency = Counter(term for doc in docs for term in terms if term in doc)
+    k1, b = 1.5, 0.75
+
+    ranked = []
+    for passage, doc in zip(passages, docs):
+        length = sum(doc.values())
+        score = 0.0
+        for term in terms:
+            if term not in doc:
+                continue
+            idf = math.log(1 + (len(docs) - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+            score += idf * doc[term] * (k1 + 1) / (doc[term] + k1 * (1 - b + b * length / average_length))
+        if score > 0:
+            ranked.append(passage.model_copy(update={"score": round(score, 3)}))
+    ranked.sort(key=lambda passage: passage.score, reverse=True)
+    return ranked
+
+
+def pack_passages(ranked: List[searchPassage], token_budget: int) -> List[searchPassage]:
+    """Take the best passages that fit the budget, skipping overlapping windows of the same page"""
+    packed = []
+    seen = set()
+    for passage in ranked:
+        cost = estimate_tokens(passage.text)
+        if cost > token_budget:
+            continue
+        words = passage.text.split()
+        # Windows overlap by half, so a neighbour shares its first or last half
+        half = PASSAGE_WORDS // 2
+        halves = (passage.source, " ".join(words[:half])), (passage.source, " ".join(words[-half:]))
+        if any(edge in seen for edge in halves):
+            continue
+        seen.update(halves)
+        packed.append(passage)
+        token_budget -= cost
+    return packed
+
+
+async def build_context(query: str, results: List[searchResult], deadline: Optional[float] = None) -> searchResults:
+    """Fetch the result pages until `deadline` (a time.monotonic() value) and keep the passages
+    most relevant to the query, within the context token budget. The snippets stay in the
+    results, so the answer is still grounded when no page arrives in time."""
+    timeout = PAGE_TIMEOUT if deadline is None else min(PAGE_TIMEOUT, deadline - time.monotonic())
+    pages = await fetch_pages([result.link for result in results], timeout)
+
+    candidates = []
+    for i, result in enumerate(results):
+        if result.link in pages:
+            candidates += [searchPassage(source=i, text=text, score=0) for text in split_passages(pages[result.link])]
+    passages = pack_passages(rank_passages(query, candidates), CONTEXT_TOKENS)
+    return searchResults(query=query, results=results, passages=passages)
@@ -1,30 +1,98 @@
 from data_models import functionCalling, searchParameters
 from typing import Optional, Dict, Any, List
+from contextlib import aclosing
+import asyncio
 import json
+import os
+import time
 import ollama
-from search_function import google_search
+from search_function import google_search, google_search_async
+from speculation import speculative_search_query
+from tools import registry, FunctionCallDetector
+from session import OllamaSession
+from backends import BackendPool
+from cache import TTLCache
 
 
 # Model name
 MODEL_NAME = "gemma:7b"
 
-def parse_function_call(response: str) -> Optional[functionCalling]:
-    """Parse the model's response to extract function calls"""
+# Start the search alongside the first model call when the question is clearly time sensitive
+SPECULATIVE_SEARCH = os.getenv('SPECULATIVE_SEARCH', '1') == '1'
+
+# Use Ollama's native `tools` parameter when the model supports it, the JSON text protocol otherwise
+NATIVE_TOOLS = os.getenv('NATIVE_TOOLS', '1') == '1'
+
+# Rounds of tool calls allowed per message before the model must answer
+MAX_TOOL_ITERATIONS = int(os.getenv('MAX_TOOL_ITERATIONS', '3'))
+
+# Ollama servers to spread requests over, e.g. OLLAMA_HOSTS=http://gpu1:11434,http://gpu2:11434
+OLLAMA_HOSTS = [
+    host.strip()
+    for host in os.getenv('OLLAMA_HOSTS', os.getenv('OLLAMA_HOST', 'http://localhost:11434')).split(',')
+    if host.strip()
+]
+
+# Async clients so streaming the model does not block the event loop the search runs on
+pool = BackendPool(
+    OLLAMA_HOSTS,
+    MODEL_NAME,
+    capacity_per_backend=int(os.getenv('OLLAMA_BACKEND_CONCURRENCY', '1')),
+    health_interval=float(os.getenv('OLLAMA_HEALTH_INTERVAL', '10')),
+    request_timeout=float(os.getenv('OLLAMA_REQUEST_TIMEOUT', '300'))
+)
+
+# Sampling options are part of the response cache key; a fixed seed makes answers repeatable
+OLLAMA_OPTIONS = json.loads(os.getenv('OLLAMA_OPTIONS', '{}')) or None
+
+# Answers only repeat when sampling is fixed; otherwise one random answer would be replayed
+DETERMINISTIC = bool(OLLAMA_OPTIONS) and ('seed' in OLLAMA_OPTIONS or OLLAMA_OPTIONS.get('temperature') == 0)
+
+# Identical model calls (same model, options and messages) are answered from this cache,
+# by default only when OLLAMA_OPTIONS sets a seed or temperature 0; LLM_CACHE=1 or 0 turns it
+# on or off regardless, and LLM_CACHE_PATH adds an SQLite tier that survives restarts
+response_cache = TTLCache(
+    max_entries=int(os.getenv('LLM_CACHE_SIZE', '512')),
+    ttl=float(os.getenv('LLM_CACHE_TTL', '3600')),
+    path=os.getenv('LLM_CACHE_PATH')
+) if os.getenv('LLM_CACHE', '1' if DETERMINISTIC else '0') == '1' else None
+
+# Keeps the model loaded and the prompt prefix stable so Ollama can reuse its KV cache
+session = OllamaSession(
+    pool,
+    MODEL_NAME,
+    keep_alive=os.getenv('OLLAMA_KEEP_ALIVE', '30m'),
+    history_token_budget=int(os.getenv('HISTORY_TOKEN_BUDGET', '2000')),
+    first_token_timeout=float(os.getenv('OLLAMA_FIRST_TOKEN_TIMEOUT', '60')),
+    options=OLLAMA_OPTIONS,
+    cache=response_cache
+)
+
+def parse_function_calls(response: str) -> List[functionCalling]:
+    """Parse text protocol function calls (one object or an array), for models without native tool support"""
     try:
         # Clean the response and find JSON structure
         response = response.strip()
-        start_idx = response.find('{')
-        end_idx = response.rfind('}') + 1
+        start_idx = min((i for i in (response.find('{'), response.find('[')) if i != -1), default=-1)
+        end_idx = max(response.rfind('}'), response.rfind(']')) + 1
         
         if start_idx == -1 or end_idx == 0:
-            return None
+            return []
             
         json_str = response[start_idx:end_idx]
         data = json.loads(json_str)
-        return functionCalling(**data)
+        if isinstance(data, dict):
+            data = [data]
+        return [functionCalling(**item) for item in data]
     except Exception as e:
         print(f"Error parsing function call: {str(e)}")
-        return None
+        return []
+
+
+def parse_function_call(response: str) -> Optional[functionCalling]:
+    """Parse the first text protocol function call"""
+    calls = parse_function_calls(response)
+    return calls[0] if calls else None
 
 
 # System message for the model
@@ -56,31 +124,6 @@ WHEN TO SEARCH:
 - Current status of changing information
 - Real-time data
 
-FUNCTION CALL FORMAT:
-When you need to search, respond WITH ONLY THE JSON OBJECT, no other text, no backticks:
-{
-    "name": "google_search",
-    "parameters": {
-        "query": "your search query"
-    }
-}
-
-SEARCH FUNCTION:
-{
-    "name": "google_search",
-    "description": "Search for real-time information",
-    "parameters": {
-        "type": "object",
-        "properties": {
-            "query": {
-                "type": "string",
-                "description": "Search term"
-            }
-        },
-        "required": ["query"]
-    }
-}
-
 RESPONSE GUIDELINES:
 1. Only include facts from search results
 2. Never add dates not in search results
@@ -88,73 +131,232 @@ RESPONSE GUIDELINES:
 4. Quote dates exactly as they appear
 5. Keep responses concise and factual"""
 
-def process_message(user_input, chat_history):
-    """Process user message and update chat history"""
+
+_native_tools = None
+
+
+def supports_tools(info) -> bool:
+    capabilities = info.get('capabilities') or []
+    return 'tools' in capabilities or '.Tools' in (info.get('template') or '')
+
+
+async def use_native_tools() -> bool:
+    """Whether the model accepts Ollama's `tools` parameter, checked once per process"""
+    global _native_tools
+    if _native_tools is None:
+        _native_tools = False
+        if NATIVE_TOOLS:
+            try:
+                _native_tools = supports_tools(await pool.pick().client.show(MODEL_NAME))
+            except Exception as e:
+                print(f"Could not read model capabilities, using the text protocol: {str(e)}")
+    return _native_tools
+
+
+def preload_model():
+    """Load the model and cache the system prompt at app start, so the first user does not wait for it"""
+    global _native_tools
+    try:
+        if _native_tools is None:
+            _native_tools = NATIVE_TOOLS and supports_tools(ollama.Client(host=OLLAMA_HOSTS[0]).show(MODEL_NAME))
+        session.preload(system_message(_native_tools))
+    except Exception as e:
+        print(f"Could not preload {MODEL_NAME}: {str(e)}")
+
+
+def system_message(native_tools: bool) -> str:
+    """The text protocol and tool list only go in the prompt when the model cannot take `tools`"""
+    if native_tools:
+        return SYSTEM_MESSAGE
+    return f"{SYSTEM_MESSAGE}\n\n{registry.describe()}"
+
+async def stream_chat(messages, tools=None, use_cache=True):
+    """Yield the message deltas (content and tool calls) of a streaming ollama chat call.
+
+    Closing this generator early closes the HTTP stream, which makes Ollama stop generating.
+    Pass use_cache=False to always ask the model.
+    """
+    async with aclosing(session.stream(messages, tools=tools, use_cache=use_cache)) as stream:
+        async for message in stream:
+            yield message
+
+
+def start_speculative_search(user_input: str):
+    """Return (query, task) for a search started ahead of the model, or (None, None)"""
+    query = speculative_search_query(user_input) if SPECULATIVE_SEARCH else None
+    if not query:
+        return None, None
+    task = asyncio.create_task(google_search_async(query))
+    # A discarded speculation may fail unobserved; retrieve the exception so it is not logged as lost
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    return query, task
+
+
+def describe_call(call: functionCalling, result: Optional[str] = None) -> str:
+    """Chat history entry for a running or finished tool call"""
+    if call.name == "google_search":
+        query = call.parameters.get("query")
+        if result is None:
+            return f"🔍 Searching for: {query}"
+        return f"🔍 Searched for: {query}\n\n📊 Result:\n{result}"
+    if result is None:
+        return f"🔧 Calling {call.name}: {json.dumps(call.parameters)}"
+    return f"🔧 Called {call.name}: {json.dumps(call.parameters)}\n\n📊 Result:\n{result}"
+
+
+async def run_tool_call(call: functionCalling, speculative_task=None, speculative_query=None) -> tuple:
+    """Execute a call, taking the result of a matching speculative search when there is one.
+
+    Returns (call, result); when the speculative result is used the call is relabelled with
+    the query that was actually searched. If the speculation fails or outlasts the tool's
+    timeout, the model's own call is run instead.
+    """
+    if speculative_task is not None:
+        try:
+            result = await asyncio.wait_for(speculative_task, timeout=registry.tools[call.name].timeout)
+            searched = call.model_copy(update={"parameters": {**call.parameters, "query": speculative_query}})
+            return searched, result.to_string()
+        except asyncio.TimeoutError:
+            print(f"Speculative search for {speculative_query!r} timed out")
+        except Exception as e:
+            print(f"Speculative search failed: {str(e)}")
+    return call, await registry.execute(call)
+
+
+async def process_message(user_input, chat_history, use_cache=True, trace=None):
+    """Process user message and update chat history; use_cache=False bypasses the response cache.
+
+    A `trace` dict, when given, is filled with the final answer, whether a search was made,
+    the tool calls and per-stage timings in seconds (model_1, tools_1, model_2, ..., total).
+    """
+    speculative_task = None
+    started = time.perf_counter()
+    trace = trace if trace is not None else {}
+    trace.update({"answer": None, "searched": False, "tool_calls": [], "timings": {}, "error": None})
+    timings = trace["timings"]
     try:
         # First, add user message to history for display
         chat_history.append({"role": "user", "content": user_input})
-        search_info = None
-        
-        # Get response from model
-        response = ollama.chat(
-            model=MODEL_NAME,
-            messages=[
-                {"role": "system", "content": SYSTEM_MESSAGE},
-                {"role": "user", "content": user_input}
-            ]
-        )
-        
-        # Get the model's response
-        model_response = response['message']['content']
-        
-        # Try to parse the response as a function call
-        function_call = parse_function_call(model_response)
+        yield chat_history
+        speculative_query, speculative_task = start_speculative_search(user_input)
+        native_tools = await use_native_tools()
+        # Earlier turns go in after the unchanged system message, so the prompt prefix is reused
+        messages = session.build_messages(system_message(native_tools), chat_history[:-1], user_input)
+        used_tools = False
         
-        if function_call and function_call.name == "google_search":
-            # Validate search parameters
-            search_params = searchParameters(**function_call.parameters)
-            search_query = search_params.query
+        for iteration in range(MAX_TOOL_ITERATIONS + 1):
+            # The last round gets no tools so the model has to answer
+            can_call = iteration < MAX_TOOL_ITERATIONS
+            prefix = "✨ Response:\n" if used_tools else ""
             
-            # Add search info to history
-            search_info = f"🔍 Searching for: {search_query}"
-            chat_history.append({"role": "assistant", "content": search_info})
-            yield chat_history
+            # Stream the response from the model. Tokens are shown as they arrive; with the text
+            # protocol, output that looks like a function call is held back while the detector
+            # parses it, and the generation is stopped as soon as the call is complete.
+            model_response = ""
+            tool_calls = []
+            streaming = False
+            tools = registry.schemas() if native_tools and can_call else None
+            detector = FunctionCallDetector(registry) if not native_tools and can_call else None
+            stage_started = time.perf_counter()
+            async with aclosing(stream_chat(messages, tools=tools, use_cache=use_cache)) as stream:
+                async for message in stream:
+                    timings.setdefault("ttft", round(time.perf_counter() - started, 4))
+                    if message.get('tool_calls'):
+                        tool_calls.extend(message['tool_calls'])
+                    delta = message.get('content') or ""
+                    model_response += delta
+                    if detector is not None:
+                        state = detector.feed(delta)
+                        if state == FunctionCallDetector.CALL:
+                            break
+                        if state == FunctionCallDetector.UNDECIDED:
+                            continue
+                    if not model_response.strip():
+                        continue
+                    if not streaming:
+                        chat_history.append({"role": "assistant", "content": ""})
+                        streaming = True
+                    chat_history[-1] = {"role": "assistant", "content": prefix + model_response}
+                    yield chat_history
+            timings[f"model_{iteration + 1}"] = round(time.perf_counter() - stage_started, 4)
+            
+            # Native tool calls arrive structured; the text protocol is parsed by the detector,
+            # with a full parse as fallback for output it could not decide on while streaming
+            if tool_calls:
+                function_calls = [
+                    functionCalling(name=call.function.name, parameters=call.function.arguments)
+                    for call in tool_calls
+                ]
+            elif detector is not None and detector.calls:
+                function_calls = detector.calls
+                # The generation was cut short; keep a well-formed call in the history
+                calls_json = [call.model_dump() for call in function_calls]
+                model_response = json.dumps(calls_json[0] if len(calls_json) == 1 else calls_json)
+                # The stream was stopped before the session could cache it, so store the call here
+                if use_cache:
+                    await session.store(messages, tools, {"role": "assistant", "content": model_response})
+            elif detector is not None and not streaming:
+                function_calls = parse_function_calls(model_response)
+            else:
+                function_calls = []
             
-            # Execute the search
-            search_result = google_search(search_query)
+            if not function_calls:
+                trace["answer"] = model_response
+                if not streaming:
+                    # The held-back output was not a function call after all, show it as is
+                    chat_history.append({"role": "assistant", "content": prefix + model_response})
+                    yield chat_history
+                break
+            
+            # The first search of the first round can take over the speculative search
+            speculative = [None] * len(function_calls)
+            if speculative_task is not None:
+                for i, call in enumerate(function_calls):
+                    if call.name == "google_search":
+                        speculative[i], speculative_task = speculative_task, None
+                        break
+            
+            # Show every call, then run them all concurrently
+            first_entry = len(chat_history)
+            for call in function_calls:
+                chat_history.append({"role": "assistant", "content": describe_call(call)})
+            yield chat_history
             
-            # Update search info with results
-            search_info = f"🔍 Searched for: {search_query}\n\n📊 Result:\n{search_result.to_string()}"
-            chat_history[-1] = {"role": "assistant", "content": search_info}
+            stage_started = time.perf_counter()
+            outcomes = await asyncio.gather(*(
+                run_tool_call(call, task, speculative_query) for call, task in zip(function_calls, speculative)
+            ))
+            timings[f"tools_{iteration + 1}"] = round(time.perf_counter() - stage_started, 4)
+            # The calls as run: a search answered by the speculation shows the query it used
+            executed = [call for call, _ in outcomes]
+            results = [result for _, result in outcomes]
+            trace["tool_calls"] += [call.model_dump() for call in executed]
+            trace["searched"] = trace["searched"] or any(call.name == "google_search" for call in executed)
+            for i, (call, result) in enumerate(zip(executed, results)):
+                chat_history[first_entry + i] = {"role": "assistant", "content": describe_call(call, result)}
             yield chat_history
+            used_tools = True
             
-            # Get final response from model with search results
-            final_response = ollama.chat(
-                model=MODEL_NAME,
-                messages=[
-                    {"role": "system", "content": SYSTEM_MESSAGE},
-                    {"role": "user", "content": user_input},
+            # Hand all results back in one follow-up turn, the same way the calls arrived
+            if tool_calls:
+                messages.append({"role": "assistant", "content": model_response, "tool_calls": tool_calls})
+                messages += [
+                    {"role": "tool", "content": result, "tool_name": call.name}
+                    for call, result in zip(function_calls, results)
+                ]
+            else:
+                messages += [
                     {"role": "assistant", "content": model_response},
-                    {"role": "user", "content": f"Based on the search results: {search_result.to_string()}"}
+                    {"role": "user", "content": "Based on the search results: " + "\n\n".join(results)}
                 ]
-            )
-            
-            assistant_response = final_response['message']['content']
-        else:
-            # If no function call, return the direct response
-            assistant_response = model_response
-        
-        # Update final response in history
-        if search_info:
-            # Add both search info and final response
-            chat_history.append({"role": "assistant", "content": f"✨ Response:\n{assistant_response}"})
-        else:
-            # Just add assistant response
-            chat_history.append({"role": "assistant", "content": assistant_response})
-        
-        yield chat_history
             
     except Exception as e:
         error_msg = f"An error occurred: {str(e)}"
+        trace["error"] = str(e)
         chat_history.append({"role": "assistant", "content": error_msg})
-        yield chat_history
\ No newline at end of file
+        yield chat_history
+    finally:
+        timings["total"] = round(time.perf_counter() - started, 4)
+        # The model answered directly, so the speculative result is discarded
+        if speculative_task is not None and not speculative_task.done():
+            speculative_task.cancel()
\ No newline at end of file
@@ -1,45 +1,187 @@
 
-from data_models import searchResult, searchParameters
+from data_models import searchResult, searchResults, searchParameters
+from cache import TTLCache
+from passages import build_context, close_page_client
+from http_clients import LoopClient
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import asyncio
+import importlib.util
+import httpx
+import random
 import requests
+import time
 import json
 import os
+import re
+from typing import List
 from dotenv import load_dotenv
 load_dotenv()
 
 # Get Serper API key from environment variables
 # Create a .env file with SERPER_API_KEY=your_api_key (do not commit .env to GitHub)
+# It is checked when a search is made, so the app can start (and answer directly) without it
 SERPER_API_KEY = os.getenv('SERPER_API_KEY')
-if not SERPER_API_KEY:
-    raise ValueError("Serper API key not found. Please set SERPER_API_KEY in your .env file.")
 
+SERPER_URL = os.getenv('SERPER_URL', "https://google.serper.dev/search")
 
-def google_search(query: str) -> searchResult:
+# Transport settings shared by the sync session and the async client
+CONNECT_TIMEOUT = float(os.getenv('SERPER_CONNECT_TIMEOUT', '3'))
+READ_TIMEOUT = float(os.getenv('SERPER_READ_TIMEOUT', '10'))
+MAX_RETRIES = int(os.getenv('SERPER_MAX_RETRIES', '3'))
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Results kept per search, and the hard limit for a search including reading the result pages
+SEARCH_RESULTS = int(os.getenv('SEARCH_RESULTS', '5'))
+SEARCH_TIME_BUDGET = float(os.getenv('SEARCH_TIME_BUDGET', '5'))
+
+# Search results are cached for a few minutes; set SEARCH_CACHE_PATH to keep them across restarts
+search_cache = TTLCache(
+    max_entries=int(os.getenv('SEARCH_CACHE_SIZE', '1024')),
+    ttl=float(os.getenv('SEARCH_CACHE_TTL', '600')),
+    path=os.getenv('SEARCH_CACHE_PATH')
+)
+
+
+def normalise_query(query: str) -> str:
+    """Lowercase and collapse whitespace so trivially different queries share a cache entry"""
+    return re.sub(r'\s+', ' ', query).strip().lower()
+
+
+def google_search(query: str) -> searchResults:
+    """Perform a Google search using Serper.dev API, answering repeated queries from the cache.
+
+    Only the result snippets are returned; google_search_async also reads the result pages.
+    """
+    results = search_cache.get_or_compute(
+        normalise_query(query),
+        lambda: [result.model_dump() for result in fetch_search_result(query)]
+    )
+    return searchResults(query=query, results=results)
+
+
+async def google_search_async(query: str) -> searchResults:
+    """Search, then fetch the top result pages and keep their passages most relevant to the query.
+
+    The whole search stays within SEARCH_TIME_BUDGET seconds: page fetches get whatever time
+    the search API call left, and pages that are not in by then are skipped.
+    """
+    deadline = time.monotonic() + SEARCH_TIME_BUDGET
+    results = await asyncio.wait_for(
+        search_cache.aget_or_compute(normalise_query(query), lambda: _fetch_search_result_dicts_async(query)),
+        timeout=SEARCH_TIME_BUDGET
+    )
+    return await build_context(query, [searchResult(**result) for result in results], deadline)
+
+
+def search_cache_stats() -> dict:
+    """Hit/miss counters of the search result cache"""
+    return search_cache.stats()
+
+
+def _headers() -> dict:
+    if not SERPER_API_KEY:
+        raise ValueError("Serper API key not found. Please set SERPER_API_KEY in your .env file.")
+    return {
+        'X-API-KEY': SERPER_API_KEY,
+        'Content-Type': 'application/json'
+    }
+
+
+def _parse_results(results: dict) -> List[searchResult]:
+    if not results.get('organic'):
+        raise ValueError("No search results found.")
+        
+    return [
+        searchResult(
+            title=result.get('title', 'No title'),
+            link=result.get('link', 'No link'),
+            snippet=result.get('snippet', 'No snippet available.')
+        )
+        for result in results['organic'][:SEARCH_RESULTS]
+    ]
+
+
+def _create_session() -> requests.Session:
+    session = requests.Session()
+    retry = Retry(
+        total=MAX_RETRIES,
+        backoff_factor=0.3,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset({"POST"})  # A search is safe to repeat
+    )
+    session.mount("https://", HTTPAdapter(pool_maxsize=20, max_retries=retry))
+    session.mount("http://", HTTPAdapter(pool_maxsize=20, max_retries=retry))
+    return session
+
+
+# Keep-alive session reused by every sync search
+http_session = _create_session()
+
+
+def fetch_search_result(query: str) -> List[searchResult]:
     """Perform a Google search using Serper.dev API"""
     try:
-        url = "https://google.serper.dev/search"
         payload = json.dumps({"q": query})
-        headers = {
-            'X-API-KEY': SERPER_API_KEY,
-            'Content-Type': 'application/json'
-        }
         
-        response = requests.post(url, headers=headers, data=payload)
+        response = http_session.post(
+            SERPER_URL,
+            headers=_headers(),
+            data=payload,
+            timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)
+        )
         response.raise_for_status()  # Raise an exception for bad status codes
         
-        results = response.json()
-        
-        if not results.get('organic'):
-            raise ValueError("No search results found.")
-            
-        first_result = results['organic'][0]
-        return searchResult(
-            title=first_result.get('title', 'No title'),
-            link=first_result.get('link', 'No link'),
-            snippet=first_result.get('snippet', 'No snippet available.')
-        )
+        return _parse_results(response.json())
     except Exception as e:
         print(f"Search error: {str(e)}")
         raise
 
 
+# Shared keep-alive client, one per event loop (clients are bound to a loop)
+_async_client = LoopClient(lambda: httpx.AsyncClient(
+    # HTTP/2 needs the optional h2 package (pip install httpx[http2])
+    http2=importlib.util.find_spec("h2") is not None,
+    limits=httpx.Limits(max_connections=20, max_keepalive_connections=20, keepalive_expiry=30),
+    timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT)
+))
+
+
+def get_async_client() -> httpx.AsyncClient:
+    return _async_client.get()
+
+
+async def close_async_client():
+    await _async_client.aclose()
+    await close_page_client()
+
+
+async def fetch_search_result_async(query: str) -> List[searchResult]:
+    """Perform a Google search using Serper.dev API, retrying transient failures with jittered backoff"""
+    client = get_async_client()
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            response = await client.post(SERPER_URL, headers=_headers(), json={"q": query})
+            if response.status_code in RETRY_STATUSES and attempt < MAX_RETRIES:
+                raise httpx.HTTPStatusError(
+                    f"Transient status {response.status_code}", request=response.request, response=response
+                )
+            response.raise_for_status()
+            return _parse_results(response.json())
+        except (httpx.TransportError, httpx.HTTPStatusError) as e:
+            transient = isinstance(e, httpx.TransportError) or e.response.status_code in RETRY_STATUSES
+            if not transient or attempt == MAX_RETRIES:
+                print(f"Search error: {str(e)}")
+                raise
+            # Full jitter keeps concurrent retries from hitting the API in lockstep
+            await asyncio.sleep(random.uniform(0, 0.3 * 2 ** attempt))
+        except Exception as e:
+            print(f"Search error: {str(e)}")
+            raise
+
+
+async def _fetch_search_result_dicts_async(query: str) -> List[dict]:
+    return [result.model_dump() for result in await fetch_search_result_async(query)]
+
+
 
@@ -0,0 +1,190 @@
+import hashlib
+import json
+import statistics
+import time
+from collections import deque
+from typing import Optional
+import asyncio
+import ollama
+from backends import BackendPool, FAILOVER_ERRORS
+from cache import TTLCache
+from tokens import estimate_tokens
+
+# Display-only entries process_message adds to the chat history
+TOOL_ENTRY_PREFIXES = ("🔍 ", "🔧 ", "An error occurred:")
+RESPONSE_PREFIX = "✨ Response:\n"
+
+
+def _jsonable(value):
+    # Messages may carry Ollama's pydantic objects, e.g. tool calls
+    return value.model_dump(exclude_none=True) if hasattr(value, "model_dump") else str(value)
+
+
+def response_cache_key(model: str, options: Optional[dict], messages: list, tools: Optional[list]) -> str:
+    """Hash of everything that determines the model's output"""
+    payload = json.dumps(
+        {"model": model, "options": options, "messages": messages, "tools": tools},
+        sort_keys=True,
+        default=_jsonable
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class OllamaSession:
+    """Builds prompts so consecutive requests share the longest possible prefix, and keeps
+    the model loaded between turns.
+
+    Ollama reuses its KV cache for a prompt prefix identical to the previous request, so the
+    system message always comes first and unchanged, followed by the conversation so far.
+    Requests go to the least-loaded backend of the pool and fail over to another one when a
+    backend errors or produces nothing within `first_token_timeout`.
+
+    With a `cache`, complete responses are stored under a hash of model, options, messages
+    and tools, and identical calls are answered from it without touching a backend. A
+    generation the caller stopped early, such as a detected function call, is stored with
+    `store()`.
+    """
+
+    def __init__(self, pool: BackendPool, model: str, keep_alive: str = "30m",
+                 history_token_budget: int = 2000, first_token_timeout: float = 60,
+                 options: Optional[dict] = None, cache: Optional[TTLCache] = None):
+        self.pool = pool
+        self.model = model
+        self.keep_alive = keep_alive
+        self.history_token_budget = history_token_budget
+        self.first_token_timeout = first_token_timeout
+        self.options = options
+        self.cache = cache
+        self.ttfts = deque(maxlen=1000)
+
+    def history_messages(self, chat_history: list) -> list:
+        """Turn the Gradio chat history into model messages, newest turns within the token budget"""
+        messages = []
+        for entry in chat_history:
+            role, content = entry.get("role"), entry.get("content")
+            if not isinstance(content, str) or role not in ("user", "assistant"):
+                continue
+            if role == "assistant":
+                if content.startswith(TOOL_ENTRY_PREFIXES):
+                    continue
+                content = content.removeprefix(RESPONSE_PREFIX)
+            messages.append({"role": role, "content": content})
+
+        # Drop the oldest turns first, always cutting before a user message
+        budget = self.history_token_budget
+        kept = []
+        for message in reversed(messages):
+            budget -= estimate_tokens(message["content"])
+            if budget < 0:
+                break
+            kept.append(message)
+        kept.reverse()
+        while kept and kept[0]["role"] != "user":
+            kept.pop(0)
+        return kept
+
+    def build_messages(self, system: str, chat_history: list, user_input: str) -> list:
+        return [
+            {"role": "system", "content": system},
+            *self.history_messages(chat_history),
+            {"role": "user", "content": user_input},
+        ]
+
+    async def stream(self, messages: list, tools: Optional[list] = None, use_cache: bool = True):
+        """Streaming chat call, answered from the response cache when possible"""
+        if self.cache is None or not use_cache:
+            async for message in self._stream_backend(messages, tools):
+                yield message
+            return
+
+        key = response_cache_key(self.model, self.options, messages, tools)
+        cached = await self.cache.aget(key)
+        if cached is not None:
+            yield ollama.Message.model_validate(cached)
+            return
+
+        content = ""
+        tool_calls = []
+        async for message in self._stream_backend(messages, tools):
+            content += message.get('content') or ""
+            tool_calls += message.get('tool_calls') or []
+            yield message
+        # Only reached when the caller consumed the whole response; aborted streams are not stored
+        response = {"role": "assistant", "content": content}
+        if tool_calls:
+            response["tool_calls"] = [call.model_dump(exclude_none=True) for call in tool_calls]
+        await self.cache.aset(key, response)
+
+    async def store(self, messages: list, tools: Optional[list], response: dict):
+        """Cache the response to a call the caller cut short, e.g. a function call the
+        detector completed before the model finished generating"""
+        if self.cache is not None:
+            await self.cache.aset(response_cache_key(self.model, self.options, messages, tools), response)
+
+    async def _stream_backend(self, messages: list, tools: Optional[list] = None):
+        """Streaming chat call that pins the model and records the time to the first token"""
+        started = time.perf_counter()
+        tried = []
+        while True:
+            backend = self.pool.pick(exclude=tried)
+            if backend is None:
+                raise ConnectionError(f"No Ollama backend could serve the request, tried {len(tried)}")
+            tried.append(backend)
+
+            async with self.pool.use(backend):
+                stream = await backend.client.chat(
+                    model=self.model,
+                    messages=messages,
+                    tools=tools,
+                    options=self.options,
+                    stream=True,
+                    keep_alive=self.keep_alive
+                )
+                try:
+                    # Only the wait for the first chunk can fail over; after that the
+                    # caller has already seen part of the answer
+                    try:
+                        chunk = await asyncio.wait_for(anext(stream), timeout=self.first_token_timeout)
+                    except StopAsyncIteration:
+                        return
+                    except FAILOVER_ERRORS as e:
+                        self.pool.mark_failed(backend, e)
+                        continue
+                    except ollama.ResponseError as e:
+                        # Server-side failures fail over, bad requests would fail everywhere
+                        if e.status_code < 500:
+                            raise
+                        self.pool.mark_failed(backend, e)
+                        continue
+
+                    self.ttfts.append(time.perf_counter() - started)
+                    yield chunk['message']
+                    async for chunk in stream:
+                        yield chunk['message']
+                    return
+                finally:
+                    await stream.aclose()
+
+    def preload(self, system: str):
+        """Load the model on every backend and put the system prompt in its KV cache"""
+        for backend in self.pool.backends:
+            started = time.perf_counter()
+            try:
+                ollama.Client(host=backend.host).chat(
+                    model=self.model,
+                    messages=[{"role": "system", "content": system}, {"role": "user", "content": "Hi"}],
+                    options={"num_predict": 1},
+                    keep_alive=self.keep_alive
+                )
+                print(f"Preloaded {self.model} on {backend.host} in {time.perf_counter() - started:.1f}s")
+            except Exception as e:
+                print(f"Could not preload {self.model} on {backend.host}: {str(e)}")
+
+    def stats(self) -> dict:
+        if not self.ttfts:
+            return {"requests": 0}
+        return {
+            "requests": len(self.ttfts),
+            "ttft_p50_ms": round(statistics.median(self.ttfts) * 1000, 1),
+            "ttft_max_ms": round(max(self.ttfts) * 1000, 1),
+        }
@@ -0,0 +1,35 @@
+import re
+from datetime import date
+from typing import Optional
+
+# The same rules SYSTEM_MESSAGE gives the model for when it must search
+TIME_SENSITIVE_TERMS = re.compile(
+    r"\b(current|currently|latest|now|present|today|recent|recently|this year|this week|this month)\b",
+    re.IGNORECASE
+)
+CHANGING_POSITION = re.compile(
+    r"\bwho(?:'s| is| are)\b.*\b(champion|president|ceo|prime minister|leader|king|queen|chairman|owner|winner|coach|head)\b",
+    re.IGNORECASE
+)
+YEAR = re.compile(r"\b(20\d\d)\b")
+
+# The model's training data ends in 2023
+KNOWLEDGE_CUTOFF_YEAR = 2023
+
+
+def speculative_search_query(user_input: str) -> Optional[str]:
+    """Return a query to search ahead of the model when the question is clearly time sensitive.
+
+    This is a cheap approximation of the model's decision; a wrong guess only costs a
+    discarded search, while a right one takes the search off the critical path.
+    """
+    text = user_input.strip()
+    if not text:
+        return None
+
+    years = [int(y) for y in YEAR.findall(text)]
+    if any(KNOWLEDGE_CUTOFF_YEAR < y <= date.today().year + 1 for y in years):
+        return text
+    if TIME_SENSITIVE_TERMS.search(text) or CHANGING_POSITION.search(text):
+        return text
+    return None
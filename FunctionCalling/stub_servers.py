@@ -0,0 +1,313 @@
+"""Local stand-ins for the Ollama chat API and the Serper search API, for offline benchmarks.
+
+The Ollama stand-in streams a canned answer at a fixed rate after a fixed prefill delay.
+Optionally it also models what the session manager saves: loading the model takes
+`load_time` when it is not loaded (it stays loaded for the request's keep_alive), and
+prompt tokens beyond the prefix shared with the previous request are evaluated at
+`prompt_tokens_per_second`, like Ollama reusing its KV cache.
+When the last message is a user question that matches one of the script rules (and the
+request offers tools), it answers with a function call instead: as structured `tool_calls`
+if the request passed `tools`, as text protocol JSON otherwise. Messages carrying tool
+results always get the answer.
+
+A script is a JSON list of rules; "{question}" in the parameters is replaced with the question:
+
+    [{"pattern": "\\\\b(latest|current)\\\\b", "call": {"name": "google_search", "parameters": {"query": "{question}"}}}]
+
+    python stub_servers.py ollama --port 11434 --tokens-per-second 40 --ttft-ms 150
+    python stub_servers.py ollama --load-ms 3000 --prompt-tokens-per-second 400
+    python stub_servers.py serper --port 8001 --latency-ms 300 --page-latency-ms 100
+"""
+import argparse
+import json
+import multiprocessing
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+from urllib.parse import parse_qs, urlencode, urlparse
+from speculation import CHANGING_POSITION, TIME_SENSITIVE_TERMS, YEAR
+
+# By default the model searches for the questions SYSTEM_MESSAGE says need a search
+DEFAULT_SCRIPT = [
+    {"pattern": pattern.pattern, "call": {"name": "google_search", "parameters": {"query": "{question}"}}}
+    for pattern in (TIME_SENSITIVE_TERMS, CHANGING_POSITION, YEAR)
+]
+
+ANSWER = ("Here is a short answer to your question, written by the stand-in model so that "
+          "the benchmark has something of a realistic length to stream back to the client. ")
+
+
+class StubServer(ThreadingHTTPServer):
+    request_queue_size = 128  # the default backlog of 5 turns bursts into 1s SYN retries
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients hang up on purpose: stopped generations, pages past their deadline
+        pass
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real APIs
+    disable_nagle_algorithm = True  # headers and body are separate writes
+
+    def read_json(self) -> dict:
+        return json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+
+    def send_json(self, payload: dict):
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def split_tokens(text: str) -> List[str]:
+    """Roughly four characters per token, like the estimate the session uses"""
+    return [text[i:i + 4] for i in range(0, len(text), 4)]
+
+
+def scripted_call(messages: list, script: list) -> Optional[dict]:
+    if not messages or messages[-1].get("role") != "user":
+        return None
+    question = messages[-1].get("content") or ""
+    if question.startswith("Based on the search results:"):
+        return None
+    for rule in script:
+        if re.search(rule["pattern"], question, re.IGNORECASE):
+            parameters = {
+                key: value.replace("{question}", question) if isinstance(value, str) else value
+                for key, value in rule["call"].get("parameters", {}).items()
+            }
+            return {"name": rule["call"]["name"], "parameters": parameters}
+    return None
+
+
+def keep_alive_seconds(keep_alive) -> float:
+    """Ollama's keep_alive: seconds or a duration like "30m"; negative keeps the model forever"""
+    if keep_alive is None:
+        return 300.0
+    if isinstance(keep_alive, str):
+        units = {"s": 1, "m": 60, "h": 3600}
+        value = float(keep_alive[:-1]) * units[keep_alive[-1]] if keep_alive[-1] in units else float(keep_alive)
+    else:
+        value = float(keep_alive)
+    return float("inf") if value < 0 else value
+
+
+def serve_ollama(port: int, tokens_per_second: float, ttft: float, answer_tokens: int,
+                 native_tools: bool, script: list, load_time: float = 0.0,
+                 prompt_tokens_per_second: float = 0.0, port_queue=None):
+    """Serve /api/chat, /api/show and /api/ps like an Ollama server with one model"""
+    answer_text = (ANSWER * (answer_tokens * 4 // len(ANSWER) + 1))[:answer_tokens * 4]
+    # Whether the model is loaded and the prompt tokens in its KV cache
+    model_state = {"loaded_until": 0.0, "cached": []}
+    state_lock = threading.Lock()
+
+    def prefill(body: dict) -> float:
+        """Seconds to load the model if needed and evaluate the uncached part of the prompt"""
+        prompt = split_tokens(json.dumps(body.get("tools") or []) + "".join(
+            f"{m.get('role')}:{m.get('content') or ''}" for m in body.get("messages", [])
+        ))
+        with state_lock:
+            delay = 0.0
+            if time.monotonic() > model_state["loaded_until"]:
+                delay += load_time
+                model_state["cached"] = []
+            shared = 0
+            for cached, token in zip(model_state["cached"], prompt):
+                if cached != token:
+                    break
+                shared += 1
+            if prompt_tokens_per_second:
+                delay += (len(prompt) - shared) / prompt_tokens_per_second
+            model_state["cached"] = prompt
+            model_state["loaded_until"] = time.monotonic() + delay + keep_alive_seconds(body.get("keep_alive"))
+        return delay
+
+    class Handler(StubHandler):
+        def do_GET(self):
+            if self.path == "/api/ps":
+                self.send_json({"models": [{"model": "stub", "name": "stub", "digest": "stub", "size": 0}]})
+            else:
+                self.send_error(404)
+
+        def do_POST(self):
+            body = self.read_json()
+            if self.path == "/api/show":
+                self.send_json({
+                    "template": "",
+                    "model_info": {},
+                    "capabilities": ["completion", "tools"] if native_tools else ["completion"],
+                })
+            elif self.path == "/api/chat":
+                self.chat(body)
+            else:
+                self.send_error(404)
+
+        def write_chunk(self, model: str, message: dict, done: bool = False, **extra):
+            line = json.dumps({
+                "model": model,
+                "created_at": "2024-01-01T00:00:00Z",
+                "message": {"role": "assistant", **message},
+                "done": done,
+                **extra,
+            }).encode() + b"\n"
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+
+        def chat(self, body: dict):
+            model = body.get("model", "stub")
+            messages = body.get("messages", [])
+            system = (messages[0].get("content") or "") if messages else ""
+            offers_tools = bool(body.get("tools")) or "FUNCTION CALL FORMAT" in system
+            call = scripted_call(messages, script) if offers_tools else None
+            delay = ttft + prefill(body)
+
+            if body.get("stream") is False:
+                # Non-streaming calls, like the session's preload
+                time.sleep(delay)
+                self.send_json({
+                    "model": model,
+                    "created_at": "2024-01-01T00:00:00Z",
+                    "message": {"role": "assistant", "content": json.dumps(call) if call else answer_text[:4]},
+                    "done": True,
+                    "done_reason": "stop",
+                })
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            time.sleep(delay)
+            try:
+                count = 0
+                if call is not None and body.get("tools"):
+                    self.write_chunk(model, {"content": "", "tool_calls": [
+                        {"function": {"name": call["name"], "arguments": call["parameters"]}}
+                    ]})
+                    count = 1
+                else:
+                    text = json.dumps(call) if call is not None else answer_text
+                    for count, token in enumerate(split_tokens(text), 1):
+                        if count > 1:
+                            time.sleep(1 / tokens_per_second)
+                        self.write_chunk(model, {"content": token})
+                self.write_chunk(model, {"content": ""}, done=True, done_reason="stop", eval_count=count)
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                # The client stopped the generation, as process_message does once a call is complete
+                self.close_connection = True
+
+    server = StubServer(("127.0.0.1", port), Handler)
+    if port_queue is not None:
+        port_queue.put(server.server_port)
+    server.serve_forever()
+
+
+def stand_in_page(query: str, number: int) -> str:
+    """An HTML page of filler paragraphs with one paragraph about the query"""
+    filler = "<p>" + "This paragraph of the stand-in page is about something else entirely. " * 8 + "</p>"
+    relevant = f"<p>Page {number} reports the following about {query}: " + "the stand-in answer. " * 10 + "</p>"
+    paragraphs = [filler] * 20
+    paragraphs.insert(number * 3 % 20, relevant)
+    return f"<html><head><style>p {{}}</style></head><body>{''.join(paragraphs)}</body></html>"
+
+
+def serve_serper(port: int, latency: float, connect_delay: float = 0, results: int = 5,
+                 page_latency: float = 0.1, port_queue=None):
+    """Serve a canned Serper response after `latency` seconds, linking to result pages the
+    same server serves after `page_latency` seconds"""
+
+    class Handler(StubHandler):
+        def setup(self):
+            # Stands in for the TCP+TLS handshake that loopback does not have
+            time.sleep(connect_delay)
+            super().setup()
+
+        def do_POST(self):
+            query = self.read_json().get("q")
+            time.sleep(latency)
+            self.send_json({
+                "organic": [{
+                    "title": f"Result {i + 1} for {query}",
+                    "link": f"http://127.0.0.1:{self.server.server_port}/page/{i + 1}?{urlencode({'q': query})}",
+                    "snippet": "A stand-in search result."
+                } for i in range(results)]
+            })
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if not url.path.startswith("/page/"):
+                self.send_error(404)
+                return
+            time.sleep(page_latency)
+            query = parse_qs(url.query).get("q", [""])[0]
+            body = stand_in_page(query, int(url.path.rsplit("/", 1)[-1])).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = StubServer(("127.0.0.1", port), Handler)
+    if port_queue is not None:
+        port_queue.put(server.server_port)
+    server.serve_forever()
+
+
+def start_in_process(target, *args):
+    """Run a stand-in on a random port in its own process, so it does not compete with the
+    client for the GIL; returns (process, port)"""
+    port_queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=target, args=(0, *args), kwargs={"port_queue": port_queue}, daemon=True)
+    process.start()
+    return process, port_queue.get(timeout=10)
+
+
+def load_script(path: Optional[str]) -> list:
+    if not path:
+        return DEFAULT_SCRIPT
+    with open(path) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ollama_parser = commands.add_parser("ollama", help="Stand-in Ollama server")
+    ollama_parser.add_argument("--port", type=int, default=11434)
+    ollama_parser.add_argument("--tokens-per-second", type=float, default=40)
+    ollama_parser.add_argument("--ttft-ms", type=float, default=150)
+    ollama_parser.add_argument("--answer-tokens", type=int, default=60)
+    ollama_parser.add_argument("--native-tools", action="store_true", help="Report tool support and answer with tool_calls")
+    ollama_parser.add_argument("--script", help="JSON file of function call rules")
+    ollama_parser.add_argument("--load-ms", type=float, default=0, help="Model load time when it is not loaded")
+    ollama_parser.add_argument("--prompt-tokens-per-second", type=float, default=0,
+                               help="Prompt evaluation rate for tokens not in the KV cache (0: free)")
+
+    serper_parser = commands.add_parser("serper", help="Stand-in Serper server")
+    serper_parser.add_argument("--port", type=int, default=8001)
+    serper_parser.add_argument("--latency-ms", type=float, default=300)
+    serper_parser.add_argument("--connect-ms", type=float, default=0)
+    serper_parser.add_argument("--results", type=int, default=5)
+    serper_parser.add_argument("--page-latency-ms", type=float, default=100)
+
+    args = parser.parse_args()
+    if args.command == "ollama":
+        print(f"Stand-in Ollama on http://127.0.0.1:{args.port}")
+        serve_ollama(args.port, args.tokens_per_second, args.ttft_ms / 1000, args.answer_tokens,
+                     args.native_tools, load_script(args.script), args.load_ms / 1000, args.prompt_tokens_per_second)
+    else:
+        print(f"Stand-in Serper on http://127.0.0.1:{args.port}/search")
+        serve_serper(args.port, args.latency_ms / 1000, args.connect_ms / 1000, args.results, args.page_latency_ms / 1000)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,3 @@
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token), good enough for budgeting"""
+    return len(text) // 4 + 1
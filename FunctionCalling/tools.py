@@ -0,0 +1,204 @@
+import asyncio
+import json
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Type
+from pydantic import BaseModel
+from data_models import functionCalling, searchParameters
+from search_function import google_search_async
+
+
+def _strip_titles(schema: Any) -> Any:
+    """Pydantic adds a title to every node; the model does not need them"""
+    if isinstance(schema, dict):
+        # A property named "title" maps to a schema dict and is kept
+        return {k: _strip_titles(v) for k, v in schema.items() if not (k == "title" and isinstance(v, str))}
+    if isinstance(schema, list):
+        return [_strip_titles(v) for v in schema]
+    return schema
+
+
+class Tool:
+    """A callable exposed to the model, with its parameters described by a Pydantic model"""
+
+    def __init__(self, name: str, description: str, parameters: Type[BaseModel],
+                 function: Callable[[BaseModel], Awaitable[str]], timeout: float):
+        self.name = name
+        self.description = description
+        self.parameters = parameters
+        self.function = function
+        self.timeout = timeout
+
+    def schema(self) -> dict:
+        return {
+            "type": "function",
+            "function": {
+                "name": self.name,
+                "description": self.description,
+                "parameters": _strip_titles(self.parameters.model_json_schema()),
+            },
+        }
+
+
+class ToolRegistry:
+    """Tools available to the model, rendered either as Ollama `tools` or as a text protocol.
+
+    At most `max_concurrency` tool calls run at once across all conversations.
+    """
+
+    def __init__(self, max_concurrency: int = 8):
+        self.tools: Dict[str, Tool] = {}
+        self.max_concurrency = max_concurrency
+        self._semaphore = None
+
+    def register(self, name: str, description: str, parameters: Type[BaseModel], timeout: float = 30):
+        """Decorator registering an async function taking the validated parameters model"""
+        def decorator(function):
+            self.tools[name] = Tool(name, description, parameters, function, timeout)
+            return function
+        return decorator
+
+    def schemas(self) -> List[dict]:
+        """Tool definitions for Ollama's native `tools` parameter"""
+        return [tool.schema() for tool in self.tools.values()]
+
+    def describe(self) -> str:
+        """Text protocol for models without native tool support"""
+        example = {"name": "<function name>", "parameters": {"<parameter>": "<value>"}}
+        return (
+            "FUNCTION CALL FORMAT:\n"
+            "When you need a function, respond WITH ONLY THE JSON OBJECT, no other text, no backticks:\n"
+            f"{json.dumps(example)}\n"
+            "To call several functions at once, respond with a JSON array of such objects.\n\n"
+            "AVAILABLE FUNCTIONS:\n"
+            + "\n".join(json.dumps(tool.schema()["function"]) for tool in self.tools.values())
+        )
+
+    def validate(self, call: functionCalling) -> BaseModel:
+        """Return the validated parameters of a call; raises for unknown tools or bad arguments"""
+        if call.name not in self.tools:
+            raise ValueError(f"Unknown function: {call.name}")
+        return self.tools[call.name].parameters(**call.parameters)
+
+    async def execute(self, call: functionCalling) -> str:
+        """Run one call within its tool's timeout; failures are returned as text for the model"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        try:
+            params = self.validate(call)
+            tool = self.tools[call.name]
+            async with self._semaphore:
+                return await asyncio.wait_for(tool.function(params), timeout=tool.timeout)
+        except asyncio.TimeoutError:
+            return f"Error: {call.name} timed out after {self.tools[call.name].timeout}s"
+        except Exception as e:
+            print(f"Tool error in {call.name}: {str(e)}")
+            return f"Error: {call.name} failed: {str(e)}"
+
+
+class FunctionCallDetector:
+    """Incremental parser for text protocol output, fed one streamed delta at a time.
+
+    It decides as early as possible whether the model is answering in text or calling
+    functions, and reports a call as soon as its name and all required parameters are
+    complete, so the caller can stop the generation instead of decoding the rest.
+    """
+
+    UNDECIDED = "undecided"
+    TEXT = "text"
+    CALL = "call"
+
+    def __init__(self, registry: "ToolRegistry"):
+        self.registry = registry
+        self.state = self.UNDECIDED
+        self.calls: List[functionCalling] = []
+        self._buffer = ""
+        self._start = None  # index of the opening { or [ in the buffer
+        self._in_string = False
+        self._escaped = False
+        self._stack = []
+
+    def feed(self, delta: str) -> str:
+        if self.state != self.UNDECIDED:
+            return self.state
+        for char in delta:
+            self._buffer += char
+            if self._start is None:
+                self._find_start()
+                if self.state == self.TEXT:
+                    return self.state
+                continue
+            self._scan(char)
+            if not self._in_string and char in '"}]' and self._try_complete():
+                self.state = self.CALL
+                return self.state
+        return self.state
+
+    def _find_start(self):
+        head = self._buffer.lstrip()
+        # Tolerate a markdown fence before the JSON
+        for fence in ("```json", "```"):
+            if head.startswith(fence):
+                head = head[len(fence):].lstrip()
+                break
+            if fence.startswith(head):
+                return
+        if not head:
+            return
+        if head[0] in "{[":
+            self._start = len(self._buffer) - len(head)
+            self._stack.append("}" if head[0] == "{" else "]")
+        else:
+            self.state = self.TEXT
+
+    def _scan(self, char: str):
+        if self._in_string:
+            if self._escaped:
+                self._escaped = False
+            elif char == "\\":
+                self._escaped = True
+            elif char == '"':
+                self._in_string = False
+        elif char == '"':
+            self._in_string = True
+        elif char in "{[":
+            self._stack.append("}" if char == "{" else "]")
+        elif char in "}]" and self._stack:
+            self._stack.pop()
+
+    def _try_complete(self) -> bool:
+        # Close whatever is still open and see whether it already forms complete calls
+        candidate = self._buffer[self._start:] + "".join(reversed(self._stack))
+        try:
+            data = json.loads(candidate)
+        except ValueError:
+            return False
+        closed = not self._stack
+        if isinstance(data, list):
+            # More calls may follow in an open array
+            if not closed:
+                return False
+        else:
+            data = [data]
+        try:
+            calls = [functionCalling(**item) for item in data]
+        except Exception:
+            return False
+        if not all(self._has_required(call) for call in calls):
+            return False
+        self.calls = calls
+        return True
+
+    def _has_required(self, call: functionCalling) -> bool:
+        tool = self.registry.tools.get(call.name)
+        if tool is None:
+            return False
+        required = tool.parameters.model_json_schema().get("required", [])
+        return all(key in call.parameters for key in required)
+
+
+registry = ToolRegistry(max_concurrency=int(os.getenv('TOOL_MAX_CONCURRENCY', '8')))
+
+
+@registry.register("google_search", "Search the web for real-time information", searchParameters, timeout=15)
+async def google_search_tool(params: searchParameters) -> str:
+    return (await google_search_async(params.query)).to_string()
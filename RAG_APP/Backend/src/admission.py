@@ -0,0 +1,135 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+from decouple import config
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted; carries a Retry-After hint in seconds."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, at most `capacity` stored."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Take one token. Returns 0 on success, otherwise seconds until a token is available."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class AdmissionController:
+    """Bounds how many LLM calls run at once.
+
+    Requests beyond `max_concurrency` wait in a short queue for at most
+    `queue_timeout` seconds. When the queue already holds `max_queue` waiters
+    the request is rejected immediately instead of piling up behind the provider.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, queue_timeout: float,
+                 client_rate: float = 0, client_burst: float = 0, max_clients: int = 10000):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.client_rate = client_rate
+        # A bucket must hold at least one whole token, or a rate below 1/s would never admit anyone
+        self.client_burst = max(1.0, client_burst or client_rate)
+        self.max_clients = max_clients
+
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._in_flight = 0
+        self._queued = 0
+        self._counters = {
+            "admitted": 0,
+            "completed": 0,
+            "rejected_queue_full": 0,
+            "rejected_queue_timeout": 0,
+            "rejected_rate_limited": 0,
+        }
+
+    def _check_client(self, client_id: str):
+        # Per-client limits are optional; a rate of 0 disables them
+        if not self.client_rate:
+            return
+        with self._lock:
+            bucket = self._buckets.get(client_id)
+            if bucket is None:
+                if len(self._buckets) >= self.max_clients:
+                    # Drop the idlest buckets; they would have refilled anyway
+                    for key in sorted(self._buckets, key=lambda k: self._buckets[k].updated)[: self.max_clients // 10 or 1]:
+                        del self._buckets[key]
+                bucket = self._buckets[client_id] = TokenBucket(self.client_rate, self.client_burst)
+            wait = bucket.take()
+            if wait:
+                self._counters["rejected_rate_limited"] += 1
+                raise AdmissionRejected("Rate limit exceeded for this client", wait)
+
+    @contextmanager
+    def admit(self, client_id: str = "anonymous"):
+        """Hold a concurrency slot for the duration of the block or raise AdmissionRejected."""
+        self._check_client(client_id)
+
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                if self._queued >= self.max_queue:
+                    self._counters["rejected_queue_full"] += 1
+                    raise AdmissionRejected("Server is busy, please retry later", self.queue_timeout)
+                self._queued += 1
+            try:
+                acquired = self._slots.acquire(timeout=self.queue_timeout)
+            finally:
+                with self._lock:
+                    self._queued -= 1
+            if not acquired:
+                with self._lock:
+                    self._counters["rejected_queue_timeout"] += 1
+                raise AdmissionRejected("Timed out waiting for capacity", self.queue_timeout)
+
+        with self._lock:
+            self._in_flight += 1
+            self._counters["admitted"] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                self._counters["completed"] += 1
+            self._slots.release()
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "in_flight": self._in_flight,
+                "queue_depth": self._queued,
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+                "tracked_clients": len(self._buckets),
+                **self._counters,
+            }
+
+
+admission = AdmissionController(
+    max_concurrency=config("CHAT_MAX_CONCURRENCY", default=4, cast=int),
+    max_queue=config("CHAT_MAX_QUEUE", default=16, cast=int),
+    queue_timeout=config("CHAT_QUEUE_TIMEOUT", default=5.0, cast=float),
+    client_rate=config("CHAT_CLIENT_RATE", default=0.0, cast=float),
+    client_burst=config("CHAT_CLIENT_BURST", default=0.0, cast=float),
+)
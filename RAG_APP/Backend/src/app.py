@@ -1,11 +1,15 @@
-from fastapi import FastAPI, Body
-from fastapi.responses import JSONResponse
-from src.rag import get_answer_and_docs
-from src.qdrant import upload_website_to_collection
+from fastapi import FastAPI, Body, Request
+from src.rag import get_answer_and_docs, highlight_snippet
+from src.qdrant import upload_website_to_collection, qdrant_client, collection_name
+from src.admission import admission, AdmissionRejected
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 import logging
 
+# orjson serialises the response bodies several times faster than the stdlib encoder
+from fastapi.responses import ORJSONResponse as JSONResponse
+
 app = FastAPI(
     title="RAG API",
     description="A simple API for RAG",
@@ -18,11 +22,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After"],
 )
 
+app.add_middleware(GZipMiddleware, minimum_size=1000)
+
 
 class Message(BaseModel):
     message: str
+    compact: bool = False
 
 class IndexingRequest(BaseModel):
     url: str
@@ -32,17 +40,68 @@ def root():
     return JSONResponse(content={"message": "Hello, World!"}, status_code=200)
 
 
+@app.get("/metrics", description="Admission control metrics")
+def metrics():
+    return JSONResponse(content=admission.metrics(), status_code=200)
+
+
 @app.post("/chat", description="Chat with the RAG API")
-def chat(message: Message):
-    response = get_answer_and_docs(message.message)
-    response_content = {
-        "Question": message.message,
-        "Answer": response["Answer"],
-        "Documents": response["Documents"]
-    }
+def chat(message: Message, request: Request):
+    client_id = request.client.host if request.client else "anonymous"
+    try:
+        with admission.admit(client_id):
+            response = get_answer_and_docs(message.message)
+    except AdmissionRejected as e:
+        return JSONResponse(
+            content={"error": e.reason},
+            status_code=429,
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    if message.compact:
+        # Chunk references only; full text is fetched on demand from /chunks/{chunk_id}
+        response_content = {
+            "Question": message.message,
+            "Answer": response["Answer"],
+            "Chunks": [
+                {
+                    "id": chunk["id"],
+                    "source": chunk["source"],
+                    "score": round(chunk["score"], 4),
+                    "snippet": highlight_snippet(chunk["text"], message.message)
+                }
+                for chunk in response["Chunks"]
+            ]
+        }
+    else:
+        response_content = {
+            "Question": message.message,
+            "Answer": response["Answer"],
+            "Documents": response["Documents"]
+        }
     return JSONResponse(content=response_content, status_code=200)
 
 
+@app.get("/chunks/{chunk_id}", description="Fetch the full text of a retrieved chunk")
+def get_chunk(chunk_id: str):
+    try:
+        points = qdrant_client.retrieve(collection_name=collection_name, ids=[chunk_id], with_payload=True)
+    except Exception as e:
+        logging.error(f"Error retrieving chunk {chunk_id}: {str(e)}")
+        return JSONResponse(content={"error": "Invalid chunk id"}, status_code=400)
+    if not points:
+        return JSONResponse(content={"error": "Chunk not found"}, status_code=404)
+
+    payload = points[0].payload or {}
+    return JSONResponse(
+        content={
+            "id": chunk_id,
+            "source": payload.get("metadata", {}).get("source"),
+            "text": payload.get("page_content", "")
+        },
+        status_code=200
+    )
+
+
 @app.post("/indexing", description= "Index a website through this endpoint")
 async def indexing(data: IndexingRequest):
     try:
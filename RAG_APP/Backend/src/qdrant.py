@@ -17,7 +17,7 @@ qdrant_client = QdrantClient(
 collection_name = "website_content"
 
 
-def create_collection(collection_name: str):
+def create_collection(collection_name: str, vector_size: int = 1536, distance: str = "Cosine"):
         
     existing_collections = [c.name for c in qdrant_client.get_collections().collections]
 
@@ -25,8 +25,8 @@ def create_collection(collection_name: str):
         qdrant_client.create_collection(
             collection_name=collection_name,
             vectors_config={
-                "size": 1536,  # Dimension of embeddings
-                "distance": "Cosine"
+                "size": vector_size,  # Dimension of embeddings
+                "distance": distance
             }
         )
         print(f"Collection '{collection_name}' created successfully.")
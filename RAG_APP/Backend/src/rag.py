@@ -5,6 +5,7 @@ from langchain.schema.runnable import RunnablePassthrough
 from langchain_core.runnables import RunnableParallel
 from operator import itemgetter
 from decouple import config
+import re
 from src.qdrant import vector_store
 
 
@@ -28,7 +29,7 @@ Answer:
 
 prompt = ChatPromptTemplate.from_template(prompt_template)
 
-retriever = vector_store.as_retriever()
+retriever_k = 4
 
 
 def format_docs_as_string(docs):
@@ -37,11 +38,36 @@ def format_docs_as_string(docs):
 
 
 def get_context_and_raw_docs(query):
-    """Retrieve docs and return both the formatted context string and raw docs."""
-    docs = retriever.invoke(query)
+    """Retrieve docs and return the formatted context string, raw docs and chunk references."""
+    docs_and_scores = vector_store.similarity_search_with_score(query, k=retriever_k)
+    docs = [doc for doc, _ in docs_and_scores]
     context_string = format_docs_as_string(docs)
     docs_array = [doc.page_content for doc in docs]
-    return {"context_string": context_string, "docs_array": docs_array}
+    chunks = [
+        {
+            "id": doc.metadata.get("_id"),
+            "source": doc.metadata.get("source"),
+            "score": score,
+            "text": doc.page_content,
+        }
+        for doc, score in docs_and_scores
+    ]
+    return {"context_string": context_string, "docs_array": docs_array, "chunks": chunks}
+
+
+def highlight_snippet(text: str, question: str, width: int = 240) -> str:
+    """Cut a short window of text around the first question term and bold the matching terms."""
+    terms = {t for t in re.findall(r"\w+", question.lower()) if len(t) > 3}
+    if not terms:
+        return text[:width] + ("..." if len(text) > width else "")
+
+    pattern = re.compile(r"\b(" + "|".join(re.escape(t) for t in sorted(terms)) + r")\b", re.IGNORECASE)
+    match = pattern.search(text)
+    start = max(0, match.start() - width // 3) if match else 0
+    end = start + width
+    snippet = text[start:end]
+    snippet = pattern.sub(lambda m: f"**{m.group(0)}**", snippet)
+    return ("..." if start > 0 else "") + snippet + ("..." if end < len(text) else "")
 
 
 def create_chain():
@@ -63,6 +89,7 @@ def create_chain():
                     | model
                 ),
                 "docs": lambda x: x["context_data"]["docs_array"], 
+                "chunks": lambda x: x["context_data"]["chunks"],
             }
         )
     )
@@ -79,5 +106,6 @@ def get_answer_and_docs(question: str):
 
     return {
         "Answer": answer,
-        "Documents": docs 
+        "Documents": docs,
+        "Chunks": response["chunks"]
     }
\ No newline at end of file
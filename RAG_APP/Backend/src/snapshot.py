@@ -0,0 +1,174 @@
+"""Export and import collection snapshots without re-embedding.
+
+A snapshot is a directory holding a `manifest.json` plus one pair of files per chunk:
+`chunk-00000.npy` with the float32 vectors and `chunk-00000.jsonl.gz` with one
+{"id", "payload"} record per row, in the same order as the vectors.
+
+Usage:
+    python -m src.snapshot export ./snapshots/website_content
+    python -m src.snapshot import ./snapshots/website_content --workers 8
+"""
+import argparse
+import gzip
+import json
+import os
+import time
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+from qdrant_client import models
+
+from src.qdrant import qdrant_client, collection_name, create_collection
+
+MANIFEST_NAME = "manifest.json"
+FORMAT_VERSION = 1
+
+
+def _write_chunk(out_dir: str, index: int, ids: list, vectors: list, payloads: list) -> dict:
+    vectors_file = f"chunk-{index:05d}.npy"
+    records_file = f"chunk-{index:05d}.jsonl.gz"
+
+    np.save(os.path.join(out_dir, vectors_file), np.asarray(vectors, dtype=np.float32))
+    with gzip.open(os.path.join(out_dir, records_file), "wt", encoding="utf-8") as f:
+        for point_id, payload in zip(ids, payloads):
+            f.write(json.dumps({"id": point_id, "payload": payload}, ensure_ascii=False) + "\n")
+
+    return {"vectors": vectors_file, "records": records_file, "count": len(ids)}
+
+
+def export_collection(out_dir: str, name: str = collection_name, chunk_size: int = 10000, scroll_size: int = 1000) -> dict:
+    """Dump ids, vectors and payloads of a collection into a snapshot directory."""
+    info = qdrant_client.get_collection(name)
+    vector_params = info.config.params.vectors
+    if isinstance(vector_params, dict):
+        raise ValueError("Named vectors are not supported by the snapshot format")
+
+    os.makedirs(out_dir, exist_ok=True)
+    chunks = []
+    ids, vectors, payloads = [], [], []
+    offset = None
+    started = time.perf_counter()
+
+    while True:
+        points, offset = qdrant_client.scroll(
+            collection_name=name,
+            limit=scroll_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=True,
+        )
+        for point in points:
+            ids.append(point.id)
+            vectors.append(point.vector)
+            payloads.append(point.payload)
+            if len(ids) >= chunk_size:
+                chunks.append(_write_chunk(out_dir, len(chunks), ids, vectors, payloads))
+                ids, vectors, payloads = [], [], []
+        if offset is None:
+            break
+
+    if ids:
+        chunks.append(_write_chunk(out_dir, len(chunks), ids, vectors, payloads))
+
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "collection": name,
+        "vector_size": vector_params.size,
+        "distance": getattr(vector_params.distance, "value", vector_params.distance),
+        "count": sum(chunk["count"] for chunk in chunks),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "chunks": chunks,
+    }
+    with open(os.path.join(out_dir, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    print(f"Exported {manifest['count']} points from '{name}' in {len(chunks)} chunks "
+          f"({time.perf_counter() - started:.1f}s)")
+    return manifest
+
+
+def _load_chunk(in_dir: str, chunk: dict):
+    vectors = np.load(os.path.join(in_dir, chunk["vectors"]))
+    ids, payloads = [], []
+    with gzip.open(os.path.join(in_dir, chunk["records"]), "rt", encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            ids.append(record["id"])
+            payloads.append(record["payload"])
+    if len(ids) != len(vectors):
+        raise ValueError(f"Chunk {chunk['records']} has {len(ids)} records but {len(vectors)} vectors")
+    return ids, vectors, payloads
+
+
+def _upsert_batch(name: str, ids: list, vectors: np.ndarray, payloads: list) -> int:
+    qdrant_client.upsert(
+        collection_name=name,
+        points=models.Batch(ids=ids, vectors=vectors.tolist(), payloads=payloads),
+        wait=True,
+    )
+    return len(ids)
+
+
+def import_collection(in_dir: str, name: str = None, workers: int = 4, batch_size: int = 256) -> int:
+    """Bulk-load a snapshot into the configured Qdrant backend, creating the collection if needed."""
+    with open(os.path.join(in_dir, MANIFEST_NAME)) as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot format version: {manifest.get('format_version')}")
+
+    name = name or manifest["collection"]
+    create_collection(name, vector_size=manifest["vector_size"], distance=manifest["distance"])
+
+    started = time.perf_counter()
+    imported = 0
+    pending = set()
+
+    def collect(return_when):
+        nonlocal imported, pending
+        done, pending = wait(pending, return_when=return_when)
+        for future in done:
+            imported += future.result()
+        print(f"Imported {imported}/{manifest['count']} points")
+
+    # Upsert batches, not chunks, are spread over the workers, so a snapshot of a single
+    # chunk is imported in parallel too; the next chunk is read while they run
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for chunk in manifest["chunks"]:
+            ids, vectors, payloads = _load_chunk(in_dir, chunk)
+            for start in range(0, len(ids), batch_size):
+                end = start + batch_size
+                pending.add(pool.submit(_upsert_batch, name, ids[start:end], vectors[start:end], payloads[start:end]))
+                # Keep a couple of batches queued per worker, not the whole snapshot in memory
+                if len(pending) >= 2 * workers:
+                    collect(FIRST_COMPLETED)
+        if pending:
+            collect(ALL_COMPLETED)
+
+    print(f"Imported {imported} points into '{name}' ({time.perf_counter() - started:.1f}s)")
+    return imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or import a collection snapshot")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Dump a collection to a snapshot directory")
+    export_parser.add_argument("path")
+    export_parser.add_argument("--collection", default=collection_name)
+    export_parser.add_argument("--chunk-size", type=int, default=10000)
+
+    import_parser = subparsers.add_parser("import", help="Load a snapshot directory into a collection")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--collection", default=None, help="Defaults to the collection in the manifest")
+    import_parser.add_argument("--workers", type=int, default=4)
+    import_parser.add_argument("--batch-size", type=int, default=256)
+
+    args = parser.parse_args()
+    if args.command == "export":
+        export_collection(args.path, name=args.collection, chunk_size=args.chunk_size)
+    else:
+        import_collection(args.path, name=args.collection, workers=args.workers, batch_size=args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""Check that concurrent queries keep their conversations apart, and measure the throughput.
+
+Runs MCPClient against stub_mcp_server.py with a stand-in model that always calls get_docs
+with the question (for up to three libraries at once) and then answers with the tool
+results, so every answer can be checked against its own question. Half of the conversations get a follow-up turn with their
+conversation ID, which must see its own first turn and nothing else.
+
+    python bench_concurrency.py --queries 50 --tool-latency 0.5 --llm-latency 0.1 --tools-per-turn 3
+    python bench_concurrency.py --queries 50 --max-servers 4 --server-concurrency 8 --crash-after 20
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import time
+from types import SimpleNamespace
+
+from anthropic.types import Message
+
+from mcp_client import MCPClient
+
+_ids = itertools.count()
+
+
+def stand_in_message(content: list, stop_reason: str) -> Message:
+    return Message.model_validate({
+        "id": f"msg_{next(_ids)}",
+        "type": "message",
+        "role": "assistant",
+        "model": "stand-in",
+        "content": content,
+        "stop_reason": stop_reason,
+        "stop_sequence": None,
+        "usage": {"input_tokens": 100, "output_tokens": 20},
+    })
+
+
+class StandInStream:
+    """Async context manager shaped like the Anthropic SDK's message stream"""
+
+    def __init__(self, message: Message, latency: float):
+        self.message = message
+        self.latency = latency
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def __aiter__(self):
+        await asyncio.sleep(self.latency)
+        for index, _ in enumerate(self.message.content):
+            yield SimpleNamespace(type="content_block_start", index=index)
+
+    async def get_final_message(self) -> Message:
+        return self.message
+
+
+LIBRARIES = ["langchain", "openai", "llama-index"]
+
+
+class StandInMessages:
+    def __init__(self, latency: float, tools_per_turn: int):
+        self.latency = latency
+        self.tools_per_turn = tools_per_turn
+
+    def stream(self, model, max_tokens, messages, tools, **kwargs):
+        last = messages[-1]["content"]
+        # A question, as a string or (with a prompt cache breakpoint) a text block
+        if isinstance(last, str) or last[0]["type"] == "text":
+            question = last if isinstance(last, str) else last[0]["text"]
+            message = stand_in_message([{
+                "type": "tool_use",
+                "id": f"toolu_{next(_ids)}",
+                "name": "get_docs",
+                "input": {"query": question, "library": library},
+            } for library in LIBRARIES[:self.tools_per_turn]], "tool_use")
+        else:
+            # All results of the turn arrive in one message, in call order
+            results = " | ".join(
+                block["content"] if isinstance(block["content"], str) else block["content"][0].text for block in last
+            )
+            message = stand_in_message([{"type": "text", "text": f"Answer: {results}"}], "end_turn")
+        return StandInStream(message, self.latency)
+
+
+class StandInLLM:
+    """Deterministic stand-in for the async Anthropic client"""
+
+    def __init__(self, latency: float = 0.1, tools_per_turn: int = 1):
+        self.messages = StandInMessages(latency, tools_per_turn)
+
+
+def check_turn(conversation_messages: list, questions: list, tools_per_turn: int) -> bool:
+    """The conversation holds exactly these questions, each answered from its own tool calls"""
+    user_texts = [m["content"] for m in conversation_messages if isinstance(m["content"], str) and m["role"] == "user"]
+    answers = [m["content"] for m in conversation_messages if m["role"] == "assistant" and isinstance(m["content"], str)]
+    expected = [
+        "Answer: " + " | ".join(
+            f"Docs for '{question}' in {library}: stand-in page content." for library in LIBRARIES[:tools_per_turn]
+        )
+        for question in questions
+    ]
+    return user_texts == questions and answers == expected
+
+
+async def run(args, server_script: str):
+    queries, tool_latency, llm_latency, tools_per_turn = args.queries, args.tool_latency, args.llm_latency, args.tools_per_turn
+    client = MCPClient(llm=StandInLLM(llm_latency, tools_per_turn), max_tool_concurrency=args.tool_concurrency)
+    await client.connect_to_server(
+        server_script,
+        env={**os.environ, "STUB_TOOL_LATENCY": str(tool_latency), "STUB_CRASH_AFTER": str(args.crash_after)},
+        min_servers=args.min_servers,
+        max_servers=args.max_servers,
+        server_concurrency=args.server_concurrency,
+        health_interval=1,
+    )
+    try:
+        questions = [f"question {i}" for i in range(queries)]
+
+        started = time.perf_counter()
+        first = await asyncio.gather(*(client.process_query(q) for q in questions))
+        first_elapsed = time.perf_counter() - started
+
+        follow_ups = {c.id: f"follow-up {i}" for i, c in enumerate(first) if i % 2 == 0}
+        started = time.perf_counter()
+        second = await asyncio.gather(*(client.process_query(q, cid) for cid, q in follow_ups.items()))
+        second_elapsed = time.perf_counter() - started
+
+        wrong = [c.id for c, q in zip(first, questions) if c.id not in follow_ups and not check_turn(c.messages, [q], tools_per_turn)]
+        wrong += [
+            c.id for c, q in zip(first, questions)
+            if c.id in follow_ups and not check_turn(c.messages, [q, follow_ups[c.id]], tools_per_turn)
+        ]
+        distinct = len({c.id for c in first}) == queries and all(c.id in follow_ups for c in second)
+
+        print(f"{queries} concurrent queries in {first_elapsed:.2f}s ({queries / first_elapsed:.1f}/s), "
+              f"one at a time would take at least {queries * (tools_per_turn * tool_latency + 2 * llm_latency):.1f}s")
+        print(f"{len(follow_ups)} concurrent follow-ups in {second_elapsed:.2f}s")
+        print(f"conversations correct: {queries - len(wrong)}/{queries}, distinct IDs: {distinct}")
+        print(f"model metrics: {client.metrics()}")
+        status = client.pool.status()
+        print(f"MCP servers: {status['size']} running, {status['respawns']} respawned, "
+              f"calls per server {[session['calls'] for session in status['sessions']]}")
+        if wrong or not distinct:
+            raise SystemExit(1)
+    finally:
+        await client.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--tool-latency", type=float, default=0.5)
+    parser.add_argument("--llm-latency", type=float, default=0.1, help="Stand-in model time to first token")
+    parser.add_argument("--tool-concurrency", type=int, default=64, help="MCPClient cap on concurrent tool calls")
+    parser.add_argument("--min-servers", type=int, default=1)
+    parser.add_argument("--max-servers", type=int, default=1)
+    parser.add_argument("--server-concurrency", type=int, default=64, help="Calls per server process before scaling up")
+    parser.add_argument("--crash-after", type=int, default=0, help="Each server process exits during its n-th get_docs call")
+    parser.add_argument("--tools-per-turn", type=int, default=1, choices=[1, 2, 3], help="get_docs calls per model response")
+    args = parser.parse_args()
+
+    server_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stub_mcp_server.py")
+    asyncio.run(run(args, server_script))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+"""Append-only JSONL log of conversation messages.
+
+Each line is one event: {"ts", "conversation_id", "start": true} begins the history of
+a conversation afresh, {"ts", "conversation_id", "message"} appends a message, and
+{"ts", "conversation_id", "truncate": n} drops all but the first n messages of the
+conversation, as when a failed turn is rolled back. A conversation continued after a
+restart, or after it was dropped from memory, starts again from an empty history under
+the same ID, so its positions only count from its latest start. Writes are queued and done
+by a background thread in batches, so logging never blocks the event loop, and each
+message is written once instead of rewriting the whole conversation. The active file is
+`conversations.jsonl`; it is rotated to `conversations.<timestamp>.jsonl` once it reaches
+`max_bytes`.
+
+Reconstruct conversations from the log:
+
+    python conversation_log.py list
+    python conversation_log.py show <conversation_id>
+"""
+from typing import Any, Dict, Iterator, List, Optional
+from collections import OrderedDict
+from datetime import datetime
+import argparse
+import glob
+import json
+import os
+import queue
+import threading
+import time
+
+from utils.logger import logger
+
+ACTIVE_FILE = "conversations.jsonl"
+
+_STOP = object()
+
+
+def to_serializable(content: Any) -> Any:
+    """Message content as plain JSON types; SDK objects are dumped to dicts"""
+    if isinstance(content, list):
+        return [to_serializable(item) for item in content]
+    if isinstance(content, dict):
+        return {key: to_serializable(value) for key, value in content.items()}
+    if hasattr(content, "to_dict"):
+        return content.to_dict()
+    if hasattr(content, "model_dump"):
+        return content.model_dump()
+    if hasattr(content, "dict"):
+        return content.dict()
+    return content
+
+
+class ConversationLog:
+    """Background writer for the conversation event log.
+
+    Queued events are written in batches of up to `batch_size`, flushed at least every
+    `flush_interval` seconds and fsynced at most every `fsync_interval` seconds.
+    """
+
+    def __init__(
+        self,
+        directory: str = "conversations",
+        max_bytes: int = 50 * 1024 * 1024,
+        batch_size: int = 500,
+        flush_interval: float = 0.5,
+        fsync_interval: float = 1.0,
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self.events_written = 0
+        self.batches_written = 0
+        self.rotations = 0
+        self.errors = 0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._file = None
+        self._last_fsync = time.monotonic()
+        os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="conversation-log", daemon=True)
+        self._thread.start()
+
+    def start(self, conversation_id: str):
+        """Queue the start of a conversation's history; earlier events of the ID no longer apply"""
+        self._queue.put({"ts": time.time(), "conversation_id": conversation_id, "start": True})
+
+    def log(self, conversation_id: str, message: dict):
+        """Queue one message of a conversation; returns immediately"""
+        self._queue.put({"ts": time.time(), "conversation_id": conversation_id, "message": message})
+
+    def truncate(self, conversation_id: str, length: int):
+        """Queue a rollback of the conversation to its first `length` messages"""
+        self._queue.put({"ts": time.time(), "conversation_id": conversation_id, "truncate": length})
+
+    def close(self, timeout: float = 10.0):
+        """Write out everything queued so far, then stop the writer"""
+        self._queue.put(_STOP)
+        self._thread.join(timeout=timeout)
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "events_written": self.events_written,
+            "batches_written": self.batches_written,
+            "rotations": self.rotations,
+            "errors": self.errors,
+        }
+
+    def _path(self) -> str:
+        return os.path.join(self.directory, ACTIVE_FILE)
+
+    def _open(self):
+        if self._file is None:
+            self._file = open(self._path(), "a", encoding="utf-8")
+        return self._file
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self._sync(force=False)
+                continue
+            batch = []
+            for event in [first] + self._drain():
+                if event is _STOP:
+                    stopping = True
+                else:
+                    batch.append(event)
+            if batch:
+                self._write(batch)
+            self._sync(force=stopping)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _drain(self) -> List[dict]:
+        events = []
+        while len(events) < self.batch_size:
+            try:
+                events.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return events
+
+    def _write(self, batch: List[dict]):
+        lines = []
+        for event in batch:
+            try:
+                if "message" in event:
+                    event["message"] = to_serializable(event["message"])
+                lines.append(json.dumps(event, default=str) + "\n")
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Could not serialise message of conversation {event.get('conversation_id')}: {e}")
+        try:
+            f = self._open()
+            f.write("".join(lines))
+            f.flush()
+            self.events_written += len(lines)
+            self.batches_written += 1
+            if f.tell() >= self.max_bytes:
+                self._rotate()
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Error writing conversation log: {e}")
+
+    def _sync(self, force: bool):
+        if self._file is None:
+            return
+        if force or time.monotonic() - self._last_fsync >= self.fsync_interval:
+            try:
+                os.fsync(self._file.fileno())
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Error syncing conversation log: {e}")
+            self._last_fsync = time.monotonic()
+
+    def _rotate(self):
+        self._sync(force=True)
+        self._file.close()
+        self._file = None
+        timestamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        os.replace(self._path(), os.path.join(self.directory, f"conversations.{timestamp}.jsonl"))
+        self.rotations += 1
+
+
+def log_files(directory: str = "conversations") -> List[str]:
+    """Rotated files oldest first, then the active file"""
+    rotated = sorted(glob.glob(os.path.join(directory, "conversations.*.jsonl")))
+    rotated = [path for path in rotated if os.path.basename(path) != ACTIVE_FILE]
+    active = os.path.join(directory, ACTIVE_FILE)
+    return rotated + ([active] if os.path.exists(active) else [])
+
+
+def read_events(directory: str = "conversations") -> Iterator[dict]:
+    for path in log_files(directory):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # A line cut short by a crash
+                    continue
+
+
+def load_conversations(directory: str = "conversations") -> Dict[str, List[dict]]:
+    """Every conversation in the log, as its list of messages in order"""
+    conversations: Dict[str, List[dict]] = OrderedDict()
+    for event in read_events(directory):
+        apply_event(conversations.setdefault(event["conversation_id"], []), event)
+    return conversations
+
+
+def load_conversation(conversation_id: str, directory: str = "conversations") -> Optional[List[dict]]:
+    messages = []
+    for event in read_events(directory):
+        if event["conversation_id"] == conversation_id:
+            apply_event(messages, event)
+    return messages or None
+
+
+def apply_event(messages: List[dict], event: dict):
+    if event.get("start"):
+        messages.clear()
+    elif "truncate" in event:
+        del messages[event["truncate"]:]
+    else:
+        messages.append(event["message"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--directory", default="conversations")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="List conversations with their message counts")
+    show = commands.add_parser("show", help="Print one conversation as JSON")
+    show.add_argument("conversation_id")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        for conversation_id, messages in load_conversations(args.directory).items():
+            print(f"{conversation_id}  {len(messages)} messages")
+    else:
+        messages = load_conversation(args.conversation_id, args.directory)
+        if messages is None:
+            raise SystemExit(f"Conversation {args.conversation_id} not found")
+        print(json.dumps(messages, indent=2))
+
+
+if __name__ == "__main__":
+    main()
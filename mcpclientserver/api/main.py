@@ -1,25 +1,88 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from contextlib import asynccontextmanager
 from mcp_client import MCPClient
+from conversation_log import ConversationLog
+from tool_cache import ToolResultCache
 from dotenv import load_dotenv
+import asyncio
+import json
 from pydantic_settings import BaseSettings
 
 load_dotenv()
 
 class Settings(BaseSettings):
     server_script_path: str = "C:\\Users\\Sundharesan.sk\\OneDrive - New Street Technologies Pvt Ltd\\Desktop\\AI_Architecting\\Architect\\mcpclientserver\\api\\mcp_server.py"
+    # Model call settings, overridable from the environment or .env (e.g. MAX_TOKENS=2000)
+    anthropic_model: str = "claude-3-5-haiku-20241022"
+    max_tokens: int = 1000
+    llm_timeout: float = 60.0
+    llm_connect_timeout: float = 5.0
+    llm_max_retries: int = 2
+    # Cache the tool definitions and conversation prefix between model calls
+    prompt_cache: bool = True
+    # Tool calls, e.g. TOOL_TIMEOUTS='{"get_docs": 40}'
+    tool_timeout: float = 30.0
+    tool_timeouts: Dict[str, float] = {}
+    tool_max_concurrency: int = 8
+    # Results of read-only tools are cached for TOOL_CACHE_TTL seconds;
+    # TOOL_CACHE_TTLS='{"get_docs": 3600, "search_docs_only": 0}' sets or turns off single tools
+    tool_cache_size: int = 1024
+    tool_cache_ttl: float = 600.0
+    tool_cache_ttls: Dict[str, float] = {}
+    # MCP server processes: scaled between min and max, each taking this many calls at once
+    mcp_min_servers: int = 1
+    mcp_max_servers: int = 4
+    mcp_server_concurrency: int = 4
+    mcp_health_interval: float = 10.0
+    # Tool list is re-read after this long even without a change notification
+    tools_ttl: float = 300.0
+    # Tool results in /query/stream events are cut to this many characters
+    stream_result_chars: int = 500
+    # Append-only conversation log, rotated at this size
+    conversation_log_dir: str = "conversations"
+    conversation_log_max_mb: int = 50
+    conversation_log_fsync_interval: float = 1.0
 
 settings = Settings()
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    client = MCPClient()
+    client = MCPClient(
+        model=settings.anthropic_model,
+        max_tokens=settings.max_tokens,
+        timeout=settings.llm_timeout,
+        connect_timeout=settings.llm_connect_timeout,
+        max_retries=settings.llm_max_retries,
+        prompt_cache=settings.prompt_cache,
+        tool_timeout=settings.tool_timeout,
+        tool_timeouts=settings.tool_timeouts,
+        max_tool_concurrency=settings.tool_max_concurrency,
+        conversation_log=ConversationLog(
+            settings.conversation_log_dir,
+            max_bytes=settings.conversation_log_max_mb * 1024 * 1024,
+            fsync_interval=settings.conversation_log_fsync_interval,
+        ),
+        tools_ttl=settings.tools_ttl,
+        event_result_chars=settings.stream_result_chars,
+        tool_cache=ToolResultCache(
+            settings.tool_cache_size,
+            default_ttl=settings.tool_cache_ttl,
+            ttls=settings.tool_cache_ttls,
+        ),
+    )
     try:
-        connected = await client.connect_to_server(settings.server_script_path)
+        connected = await client.connect_to_server(
+            settings.server_script_path,
+            min_servers=settings.mcp_min_servers,
+            max_servers=settings.mcp_max_servers,
+            server_concurrency=settings.mcp_server_concurrency,
+            health_interval=settings.mcp_health_interval,
+        )
         if not connected:
             raise HTTPException(status_code=500, detail="Failed to connect to MCP server.")
         app.state.client = client
@@ -43,6 +106,8 @@ app.add_middleware(
 
 class QueryRequest(BaseModel):
     query: str
+    # Continue an earlier conversation; a new one is started when omitted
+    conversation_id: Optional[str] = None
 
 class Message(BaseModel):
     role: str
@@ -57,27 +122,82 @@ class ToolCall(BaseModel):
 async def process_query(request: QueryRequest):
     # Process query and return results
     try:
-        messages = await app.state.client.process_query(
-            request.query
+        conversation = await app.state.client.process_query(
+            request.query, request.conversation_id
         )
-        return {"messages": messages}
+        return {
+            "conversation_id": conversation.id,
+            "messages": conversation.messages,
+            "usage": conversation.usage,
+        }
     except Exception as e:
         print(f"Error in query: {e}")
         raise HTTPException(status_code=500, detail=str(e))
     
+def sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@app.post("/query/stream")
+async def process_query_stream(request: QueryRequest, http_request: Request):
+    # Same as /query, sent as server-sent events while the answer is produced:
+    # conversation, text, tool_start, tool_end, then usage (or error)
+    client = app.state.client
+    conversation = client.get_conversation(request.conversation_id)
+    events: asyncio.Queue = asyncio.Queue()
+
+    async def stream():
+        task = asyncio.create_task(client.process_query(
+            request.query, conversation.id, on_event=lambda name, data: events.put_nowait((name, data))
+        ))
+        # Marks the end of the events
+        task.add_done_callback(lambda _: events.put_nowait(None))
+        try:
+            yield sse("conversation", {"conversation_id": conversation.id})
+            while True:
+                # Stop working for a client that has gone away, also while events keep coming
+                if await http_request.is_disconnected():
+                    print(f"Client disconnected, cancelling query for conversation {conversation.id}")
+                    return
+                try:
+                    event = await asyncio.wait_for(events.get(), timeout=1.0)
+                except asyncio.TimeoutError:
+                    continue
+                if event is None:
+                    break
+                yield sse(*event)
+            try:
+                task.result()
+                yield sse("usage", {"conversation_id": conversation.id, "usage": conversation.usage})
+            except Exception as e:
+                print(f"Error in query stream: {e}")
+                yield sse("error", {"detail": str(e)})
+        finally:
+            # Also reached when Starlette closes the generator on a disconnect
+            task.cancel()
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/metrics")
+async def metrics():
+    return {
+        **app.state.client.metrics(),
+        "mcp_pool": app.state.client.pool.status(),
+        "conversation_log": app.state.client.conversation_log.stats(),
+        "tool_catalogue": app.state.client.catalogue.status(),
+        "tool_cache": app.state.client.tool_cache.stats(),
+    }
+
 @app.get("/tools")
-async def tools():
+async def tools(request: Request, response: Response):
+    # Served from the client's catalogue; clients revalidate with If-None-Match
     try:
-        tools = await app.state.client.get_mcp_tools()
-        return {
-            "tools": [
-                {
-                    "name": tool.name,
-                    "description": tool.description,
-                    "input_schema": tool.inputSchema
-                } for tool in tools
-            ]
-        }
+        catalogue = app.state.client.catalogue
+        body = catalogue.to_dict()
+        headers = {"ETag": catalogue.etag, "Cache-Control": "no-cache"}
+        if catalogue.etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+            return Response(status_code=304, headers=headers)
+        response.headers.update(headers)
+        return body
     except Exception as e:
         print(f"Error in tools: {e}")
         raise HTTPException(status_code=500, detail=str(e))
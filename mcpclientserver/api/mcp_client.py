@@ -1,31 +1,132 @@
-from typing import Optional
+from typing import Callable, Dict, List, Optional
+from collections import OrderedDict, deque
 from contextlib import AsyncExitStack
+import asyncio
+import statistics
+import time
 import traceback
+import uuid
 
 # from utils.logger import logger
-from mcp import ClientSession, StdioServerParameters
-from mcp.client.stdio import stdio_client
-from datetime import datetime
+from mcp import StdioServerParameters
+from mcp_pool import MCPServerPool
+from conversation_log import ConversationLog
+from tool_catalogue import ToolCatalogue
+from tool_cache import ToolResultCache
+from datetime import timedelta
 from utils.logger import logger
-import json
-import os
 
-from anthropic import Anthropic
+import httpx
+from anthropic import AsyncAnthropic
 from anthropic.types import Message
 
 
+class Conversation:
+    """Message history of one conversation; each request works on its own instance"""
+
+    def __init__(self, conversation_id: Optional[str] = None):
+        self.id = conversation_id or uuid.uuid4().hex
+        self.messages: List[dict] = []
+        # Token usage and time to first token of the latest query
+        self.usage: dict = {}
+        # Requests continuing the same conversation take turns
+        self.lock = asyncio.Lock()
+
+
+def with_cache_breakpoint(messages: List[dict]) -> List[dict]:
+    """Copy of the messages with a prompt cache breakpoint on the last content block.
+
+    Everything up to the newest message is resent unchanged on the next call of the tool
+    loop and on the next turn, so it is cached here and read back then. The stored
+    conversation is left as it is.
+    """
+    if not messages:
+        return messages
+    last = messages[-1]
+    content = last["content"]
+    if isinstance(content, str):
+        content = [{"type": "text", "text": content}]
+    if not content:
+        return messages
+    content = list(content)
+    content[-1] = {**to_block(content[-1]), "cache_control": {"type": "ephemeral"}}
+    return messages[:-1] + [{**last, "content": content}]
+
+
+def to_block(block) -> dict:
+    if isinstance(block, dict):
+        return block
+    if hasattr(block, "to_dict"):
+        return block.to_dict()
+    return block.model_dump()
+
+
 class MCPClient:
-    def __init__(self):
+    def __init__(
+        self,
+        llm=None,
+        max_conversations: int = 1000,
+        model: str = "claude-3-5-haiku-20241022",
+        max_tokens: int = 1000,
+        timeout: float = 60.0,
+        connect_timeout: float = 5.0,
+        max_retries: int = 2,
+        tool_timeout: float = 30.0,
+        tool_timeouts: Optional[Dict[str, float]] = None,
+        max_tool_concurrency: int = 8,
+        conversation_log: Optional[ConversationLog] = None,
+        tools_ttl: float = 300.0,
+        event_result_chars: int = 500,
+        tool_cache: Optional[ToolResultCache] = None,
+        prompt_cache: bool = True,
+    ):
         # Initialize session and client objects
-        self.session: Optional[ClientSession] = None
+        self.pool: Optional[MCPServerPool] = None
         self.exit_stack = AsyncExitStack()
-        self.llm = Anthropic()
-        self.tools = []
-        self.messages = []
+        # The async client keeps the event loop free for other requests while the model answers
+        self.llm = llm or AsyncAnthropic(
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+            max_retries=max_retries,
+        )
+        self.model = model
+        self.max_tokens = max_tokens
+        # Prompt cache breakpoints on the tool definitions and the latest message
+        self.prompt_cache = prompt_cache
+        # Tool definitions are listed once and refreshed when the server reports a change or after tools_ttl
+        self.catalogue = ToolCatalogue(self.get_mcp_tools, ttl=tools_ttl)
+        # Tool calls: default timeout, per-tool overrides and a cap on concurrent calls
+        self.tool_timeout = tool_timeout
+        self.tool_timeouts = tool_timeouts or {}
+        self.tool_semaphore = asyncio.Semaphore(max_tool_concurrency)
+        # Results of read-only tools are reused for repeated calls with the same arguments
+        self.tool_cache = tool_cache or ToolResultCache()
+        # Tool results in progress events are cut to this many characters
+        self.event_result_chars = event_result_chars
+        # Model call metrics across all conversations
+        self.ttfts = deque(maxlen=1000)
+        self.llm_calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cache_read_tokens = 0
+        self.cache_write_tokens = 0
+        # The MCP server pool and tools are shared; conversations are kept per ID, least recently used dropped first
+        self.conversations: Dict[str, Conversation] = OrderedDict()
+        self.max_conversations = max_conversations
+        # Messages are appended to the JSONL log by a background writer as they arrive
+        self.conversation_log = conversation_log or ConversationLog()
         self.logger = logger
 
     # connect to the MCP server
-    async def connect_to_server(self, server_script_path: str):
+    async def connect_to_server(
+        self,
+        server_script_path: str,
+        env: Optional[Dict[str, str]] = None,
+        min_servers: int = 1,
+        max_servers: int = 1,
+        server_concurrency: int = 4,
+        health_interval: float = 10.0,
+    ):
+        """Start between `min_servers` and `max_servers` server processes, scaled with the load"""
         try:
             is_python = server_script_path.endswith(".py")
             is_js = server_script_path.endswith(".js")
@@ -34,30 +135,24 @@ class MCPClient:
 
             command = "python" if is_python else "node"
             server_params = StdioServerParameters(
-                command=command, args=[server_script_path], env=None
+                command=command, args=[server_script_path], env=env
             )
 
-            stdio_transport = await self.exit_stack.enter_async_context(
-                stdio_client(server_params)
-            )
-            self.stdio, self.write = stdio_transport
-            self.session = await self.exit_stack.enter_async_context(
-                ClientSession(self.stdio, self.write)
+            self.pool = await self.exit_stack.enter_async_context(
+                MCPServerPool(
+                    server_params,
+                    min_size=min_servers,
+                    max_size=max_servers,
+                    session_concurrency=server_concurrency,
+                    health_interval=health_interval,
+                )
             )
 
-            await self.session.initialize()
+            self.pool.on_tools_changed = self.catalogue.invalidate
 
             self.logger.info("Connected to MCP server")
 
-            mcp_tools = await self.get_mcp_tools()
-            self.tools = [
-                {
-                    "name": tool.name,
-                    "description": tool.description,
-                    "input_schema": tool.inputSchema,
-                }
-                for tool in mcp_tools
-            ]
+            await self.catalogue.refresh()
 
             self.logger.info(
                 f"Available tools: {[tool['name'] for tool in self.tools]}"
@@ -70,33 +165,76 @@ class MCPClient:
             traceback.print_exc()
             raise
 
+    @property
+    def tools(self) -> List[dict]:
+        definitions = self.catalogue.current()
+        return self.catalogue.cached_definitions if self.prompt_cache else definitions
+
     # get mcp tool list
     async def get_mcp_tools(self):
         try:
-            response = await self.session.list_tools()
+            response = await self.pool.list_tools()
             return response.tools
         except Exception as e:
             self.logger.error(f"Error getting MCP tools: {e}")
             raise
 
+    # get or start a conversation
+    def get_conversation(self, conversation_id: Optional[str] = None) -> Conversation:
+        conversation = self.conversations.get(conversation_id) if conversation_id else None
+        if conversation is None:
+            conversation = Conversation(conversation_id)
+            self.conversations[conversation.id] = conversation
+            # The log may already hold an older history under this ID; this one starts empty
+            self.conversation_log.start(conversation.id)
+            while len(self.conversations) > self.max_conversations:
+                self.conversations.popitem(last=False)
+        self.conversations.move_to_end(conversation.id)
+        return conversation
+
     # process query
-    async def process_query(self, query: str):
+    async def process_query(
+        self,
+        query: str,
+        conversation_id: Optional[str] = None,
+        on_event: Optional[Callable[[str, dict], None]] = None,
+    ) -> Conversation:
+        """Answer a query, continuing the conversation with the given ID or starting a new one.
+
+        `on_event(name, data)`, when given, is called as the answer progresses with "text"
+        deltas, "tool_start" and "tool_end" for each tool call.
+        """
+        conversation = self.get_conversation(conversation_id)
+        async with conversation.lock:
+            await self._process_query(query, conversation, on_event)
+        return conversation
+
+    async def _process_query(self, query: str, conversation: Conversation, on_event=None):
+        turn_start = len(conversation.messages)
         try:
-            self.logger.info(f"Processing query: {query}")
-            user_message = {"role": "user", "content": query}
-            self.messages = [user_message]
+            self.logger.info(f"Processing query for conversation {conversation.id}: {query}")
+            self.add_message(conversation, {"role": "user", "content": query})
+            conversation.usage = {
+                "llm_calls": 0,
+                "input_tokens": 0,
+                "output_tokens": 0,
+                "cache_read_tokens": 0,
+                "cache_write_tokens": 0,
+                "ttft_ms": [],
+            }
 
             while True:
-                response = await self.call_llm()
+                response = await self.call_llm(conversation.messages, conversation.usage, on_event)
+
+                tool_uses = [content for content in response.content if content.type == "tool_use"]
 
                 # the response is a text message
-                if response.content[0].type == "text" and len(response.content) == 1:
-                    assistant_message = {
-                        "role": "assistant",
-                        "content": response.content[0].text,
-                    }
-                    self.messages.append(assistant_message)
-                    await self.log_conversation()
+                if not tool_uses:
+                    if len(response.content) == 1 and response.content[0].type == "text":
+                        content = response.content[0].text
+                    else:
+                        content = response.to_dict()["content"]
+                    self.add_message(conversation, {"role": "assistant", "content": content})
                     break
 
                 # the response is a tool call
@@ -104,107 +242,171 @@ class MCPClient:
                     "role": "assistant",
                     "content": response.to_dict()["content"],
                 }
-                self.messages.append(assistant_message)
-                await self.log_conversation()
-
-                for content in response.content:
-                    if content.type == "tool_use":
-                        tool_name = content.name
-                        tool_args = content.input
-                        tool_use_id = content.id
-                        self.logger.info(
-                            f"Calling tool {tool_name} with args {tool_args}"
-                        )
-                        try:
-                            result = await self.session.call_tool(tool_name, tool_args)
-                            self.logger.info(f"Tool {tool_name} result: {result}...")
-                            self.messages.append(
-                                {
-                                    "role": "user",
-                                    "content": [
-                                        {
-                                            "type": "tool_result",
-                                            "tool_use_id": tool_use_id,
-                                            "content": result.content,
-                                        }
-                                    ],
-                                }
-                            )
-                            await self.log_conversation()
-                        except Exception as e:
-                            self.logger.error(f"Error calling tool {tool_name}: {e}")
-                            raise
-
-            return self.messages
+                self.add_message(conversation, assistant_message)
 
+                # Independent calls run concurrently; their results go back in one message, in call order
+                tool_results = await asyncio.gather(*(self.call_tool(content, on_event) for content in tool_uses))
+                self.add_message(conversation, {"role": "user", "content": list(tool_results)})
+
+        except asyncio.CancelledError:
+            # The client went away; drop the unfinished turn so the conversation can go on
+            self.logger.info(f"Query for conversation {conversation.id} cancelled")
+            self.rollback(conversation, turn_start)
+            raise
         except Exception as e:
             self.logger.error(f"Error processing query: {e}")
+            # A half-finished turn (e.g. a tool_use without its results) would be rejected on every later request
+            self.rollback(conversation, turn_start)
             raise
 
+    # append a message to the conversation and its log
+    def add_message(self, conversation: Conversation, message: dict):
+        conversation.messages.append(message)
+        self.conversation_log.log(conversation.id, message)
+
+    # drop the messages of an unfinished turn, in memory and in the log
+    def rollback(self, conversation: Conversation, length: int):
+        if len(conversation.messages) > length:
+            del conversation.messages[length:]
+            self.conversation_log.truncate(conversation.id, length)
+
+    # call a tool
+    async def call_tool(self, tool_use, on_event=None) -> dict:
+        """Run one tool_use block and return its tool_result block.
+
+        Each tool gets its own timeout, and at most `max_tool_concurrency` calls run at once
+        across all conversations. Results of cacheable tools come from the tool cache when
+        they can. Failures come back as error results the model can react to.
+        """
+        self.logger.info(f"Calling tool {tool_use.name} with args {tool_use.input}")
+        if on_event:
+            on_event("tool_start", {"id": tool_use.id, "name": tool_use.name, "args": tool_use.input})
+        ttl = self.tool_cache.ttl_for(self.catalogue.by_name.get(tool_use.name), tool_use.name)
+        started = time.perf_counter()
+        cached = False
+        try:
+            if ttl > 0:
+                result, cached = await self.tool_cache.get_or_call(
+                    tool_use.name, tool_use.input, ttl, lambda: self._call_server(tool_use)
+                )
+            else:
+                result = await self._call_server(tool_use)
+            content, is_error = result.content, result.isError
+            self.logger.info(
+                f"Tool {tool_use.name} finished in {time.perf_counter() - started:.2f}s"
+                f"{' from the cache' if cached else ''}: {result}..."
+            )
+        except Exception as e:
+            self.logger.error(f"Error calling tool {tool_use.name} after {time.perf_counter() - started:.2f}s: {e}")
+            content, is_error = f"Error: {tool_use.name} failed: {e}", True
+        tool_result = {"type": "tool_result", "tool_use_id": tool_use.id, "content": content}
+        if is_error:
+            tool_result["is_error"] = True
+        if on_event:
+            text = content if isinstance(content, str) else " ".join(getattr(c, "text", "") for c in content)
+            on_event("tool_end", {
+                "id": tool_use.id,
+                "name": tool_use.name,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+                "is_error": bool(is_error),
+                "cached": cached,
+                "result": text[:self.event_result_chars],
+                "truncated": len(text) > self.event_result_chars,
+            })
+        return tool_result
+
+    async def _call_server(self, tool_use):
+        timeout = self.tool_timeouts.get(tool_use.name, self.tool_timeout)
+        async with self.tool_semaphore:
+            # One deadline for waiting on a pool session and the call itself
+            try:
+                return await asyncio.wait_for(
+                    self.pool.call_tool(tool_use.name, tool_use.input, read_timeout_seconds=timedelta(seconds=timeout)),
+                    timeout=timeout,
+                )
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"{tool_use.name} timed out after {timeout}s") from None
+
     # call llm
-    async def call_llm(self):
+    async def call_llm(self, messages: List[dict], usage: Optional[dict] = None, on_event=None) -> Message:
+        """Stream a model response, recording time to first token and token usage.
+
+        Returns the complete message once the stream ends; `usage`, when given, accumulates
+        the counts for the current query. Text deltas are passed to `on_event` as they arrive.
+        """
         try:
             self.logger.info("Calling LLM")
-            return self.llm.messages.create(
-                model="claude-3-5-haiku-20241022",
-                max_tokens=1000,
-                messages=self.messages,
+            started = time.perf_counter()
+            ttft = None
+            async with self.llm.messages.stream(
+                model=self.model,
+                max_tokens=self.max_tokens,
+                messages=with_cache_breakpoint(messages) if self.prompt_cache else messages,
                 tools=self.tools,
+            ) as stream:
+                async for event in stream:
+                    if ttft is None and event.type in ("content_block_start", "content_block_delta"):
+                        ttft = time.perf_counter() - started
+                    if on_event and event.type == "content_block_delta" and event.delta.type == "text_delta":
+                        on_event("text", {"text": event.delta.text})
+                response = await stream.get_final_message()
+
+            self.record_usage(response, ttft, usage)
+            self.logger.info(
+                f"LLM answered in {time.perf_counter() - started:.2f}s, "
+                f"first token after {ttft or 0:.2f}s, "
+                f"{response.usage.input_tokens} input / {response.usage.output_tokens} output tokens, "
+                f"{response.usage.cache_read_input_tokens or 0} read from / "
+                f"{response.usage.cache_creation_input_tokens or 0} written to the prompt cache"
             )
+            return response
         except Exception as e:
             self.logger.error(f"Error calling LLM: {e}")
             raise
 
+    def record_usage(self, response: Message, ttft: Optional[float], usage: Optional[dict] = None):
+        self.llm_calls += 1
+        self.input_tokens += response.usage.input_tokens
+        self.output_tokens += response.usage.output_tokens
+        # Not included in input_tokens
+        cache_read = response.usage.cache_read_input_tokens or 0
+        cache_write = response.usage.cache_creation_input_tokens or 0
+        self.cache_read_tokens += cache_read
+        self.cache_write_tokens += cache_write
+        if ttft is not None:
+            self.ttfts.append(ttft)
+        if usage is not None:
+            usage["llm_calls"] += 1
+            usage["input_tokens"] += response.usage.input_tokens
+            usage["output_tokens"] += response.usage.output_tokens
+            usage["cache_read_tokens"] += cache_read
+            usage["cache_write_tokens"] += cache_write
+            if ttft is not None:
+                usage["ttft_ms"].append(round(ttft * 1000, 1))
+
+    def metrics(self) -> dict:
+        ttfts = sorted(self.ttfts)
+        prompt_tokens = self.input_tokens + self.cache_read_tokens + self.cache_write_tokens
+        return {
+            "llm_calls": self.llm_calls,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "cache_read_tokens": self.cache_read_tokens,
+            "cache_write_tokens": self.cache_write_tokens,
+            # Share of all prompt tokens that were read from the cache
+            "cache_read_ratio": round(self.cache_read_tokens / prompt_tokens, 4) if prompt_tokens else 0.0,
+            "ttft_p50_ms": round(statistics.median(ttfts) * 1000, 1) if ttfts else None,
+            "ttft_p95_ms": round(ttfts[max(int(len(ttfts) * 0.95) - 1, 0)] * 1000, 1) if ttfts else None,
+        }
+
     # cleanup
     async def cleanup(self):
         try:
             await self.exit_stack.aclose()
             self.logger.info("Disconnected from MCP server")
+            # Waits for the queued messages to be written
+            await asyncio.to_thread(self.conversation_log.close)
         except Exception as e:
             self.logger.error(f"Error during cleanup: {e}")
             traceback.print_exc()
             raise
-
-    async def log_conversation(self):
-        os.makedirs("conversations", exist_ok=True)
-
-        serializable_conversation = []
-
-        for message in self.messages:
-            try:
-                serializable_message = {"role": message["role"], "content": []}
-
-                # Handle both string and list content
-                if isinstance(message["content"], str):
-                    serializable_message["content"] = message["content"]
-                elif isinstance(message["content"], list):
-                    for content_item in message["content"]:
-                        if hasattr(content_item, "to_dict"):
-                            serializable_message["content"].append(
-                                content_item.to_dict()
-                            )
-                        elif hasattr(content_item, "dict"):
-                            serializable_message["content"].append(content_item.dict())
-                        elif hasattr(content_item, "model_dump"):
-                            serializable_message["content"].append(
-                                content_item.model_dump()
-                            )
-                        else:
-                            serializable_message["content"].append(content_item)
-
-                serializable_conversation.append(serializable_message)
-            except Exception as e:
-                self.logger.error(f"Error processing message: {str(e)}")
-                self.logger.debug(f"Message content: {message}")
-                raise
-
-        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        filepath = os.path.join("conversations", f"conversation_{timestamp}.json")
-
-        try:
-            with open(filepath, "w") as f:
-                json.dump(serializable_conversation, f, indent=2, default=str)
-        except Exception as e:
-            self.logger.error(f"Error writing conversation to file: {str(e)}")
-            self.logger.debug(f"Serializable conversation: {serializable_conversation}")
-            raise
\ No newline at end of file
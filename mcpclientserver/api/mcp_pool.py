@@ -0,0 +1,345 @@
+from typing import Any, Callable, Dict, List, Optional, Set
+from datetime import timedelta
+import asyncio
+import time
+
+import anyio
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+from mcp.shared.exceptions import McpError
+from mcp.types import CONNECTION_CLOSED, ServerNotification, ToolListChangedNotification
+from utils.logger import logger
+
+# Errors meaning the server process is gone rather than the tool failing
+CONNECTION_ERRORS = (ConnectionError, anyio.ClosedResourceError, anyio.BrokenResourceError, anyio.EndOfStream)
+
+
+def is_connection_error(e: Exception) -> bool:
+    if isinstance(e, McpError):
+        return e.error.code == CONNECTION_CLOSED
+    return isinstance(e, CONNECTION_ERRORS)
+
+
+class PooledSession:
+    """One MCP server process and its client session.
+
+    The stdio transport and session are anyio context managers whose cancel scopes must be
+    entered and exited in the same task, so each session lives in a task of its own that
+    holds them open until `stop()` is called.
+    """
+
+    def __init__(self, number: int, server_params: StdioServerParameters, message_handler=None):
+        self.number = number
+        self.server_params = server_params
+        self.message_handler = message_handler
+        self.session: Optional[ClientSession] = None
+        self.in_flight = 0
+        self.calls = 0
+        self.healthy = False
+        self.last_used = time.monotonic()
+        self.last_error: Optional[str] = None
+        self._ready = asyncio.Event()
+        self._stop = asyncio.Event()
+        self._closed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, timeout: float):
+        self._task = asyncio.create_task(self._run())
+        await asyncio.wait_for(self._ready.wait(), timeout=timeout)
+        if self.session is None:
+            raise ConnectionError(f"MCP server {self.number} failed to start: {self.last_error}")
+
+    async def _run(self):
+        try:
+            async with stdio_client(self.server_params) as (read, write):
+                async with ClientSession(read, write, message_handler=self.message_handler) as session:
+                    await session.initialize()
+                    self.session = session
+                    self.healthy = True
+                    self._ready.set()
+                    await self._stop.wait()
+        except Exception as e:
+            self.last_error = str(e) or type(e).__name__
+            logger.error(f"MCP server {self.number} stopped: {self.last_error}")
+        finally:
+            self.session = None
+            self.healthy = False
+            self._ready.set()
+            self._closed.set()
+
+    async def request(self, method: str, *args, **kwargs):
+        """Call a ClientSession method, failing fast if the server process goes away meanwhile.
+
+        When the transport dies its task group is torn down, and requests already sent may
+        otherwise never hear back before their timeout.
+        """
+        if self.session is None:
+            raise ConnectionError(f"MCP server {self.number} is not running")
+        call = asyncio.ensure_future(getattr(self.session, method)(*args, **kwargs))
+        closed = asyncio.ensure_future(self._closed.wait())
+        try:
+            await asyncio.wait({call, closed}, return_when=asyncio.FIRST_COMPLETED)
+        except BaseException:
+            call.cancel()
+            raise
+        finally:
+            closed.cancel()
+        if not call.done():
+            call.cancel()
+            raise ConnectionError(f"MCP server {self.number} exited: {self.last_error}")
+        return call.result()
+
+    async def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            try:
+                await asyncio.wait_for(self._task, timeout=5)
+            except Exception:
+                self._task.cancel()
+
+    def status(self) -> dict:
+        return {
+            "number": self.number,
+            "healthy": self.healthy,
+            "in_flight": self.in_flight,
+            "calls": self.calls,
+            "last_error": self.last_error,
+        }
+
+
+class MCPServerPool:
+    """Several MCP server processes behind one call_tool.
+
+    Each call goes to the least-busy healthy session. When every session already runs
+    `session_concurrency` calls, callers queue; once `scale_up_queue_depth` of them are
+    waiting, another process is started, up to `max_size`; after a failed start the next
+    one waits `start_backoff` seconds, doubling up to `max_start_backoff`. Sessions idle for
+    `idle_timeout` seconds are stopped down to `min_size`. A background task pings every session and
+    replaces those that died, and a call that loses its server is retried once elsewhere.
+    """
+
+    def __init__(
+        self,
+        server_params: StdioServerParameters,
+        min_size: int = 1,
+        max_size: int = 4,
+        session_concurrency: int = 4,
+        scale_up_queue_depth: int = 1,
+        health_interval: float = 10.0,
+        idle_timeout: float = 300.0,
+        start_timeout: float = 30.0,
+        start_backoff: float = 1.0,
+        max_start_backoff: float = 30.0,
+    ):
+        self.server_params = server_params
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size)
+        self.session_concurrency = session_concurrency
+        self.scale_up_queue_depth = scale_up_queue_depth
+        self.health_interval = health_interval
+        self.idle_timeout = idle_timeout
+        self.start_timeout = start_timeout
+        self.start_backoff = start_backoff
+        self.max_start_backoff = max_start_backoff
+        self.sessions: List[PooledSession] = []
+        # Called when a server reports that its tools changed
+        self.on_tools_changed: Optional[Callable[[], None]] = None
+        self.waiting = 0
+        self.respawns = 0
+        self._starting = 0
+        self._numbers = 0
+        self._available = asyncio.Condition()
+        self._health_task: Optional[asyncio.Task] = None
+        # Scale-ups and respawns run in the background; the loop only keeps weak references to tasks
+        self._tasks: Set[asyncio.Task] = set()
+        self._start_failures = 0
+        self._next_start = 0.0
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def start(self):
+        await asyncio.gather(*(self._add_session() for _ in range(self.min_size)))
+        self._health_task = asyncio.create_task(self._health_loop())
+        logger.info(f"Started {len(self.sessions)} MCP server processes")
+
+    async def close(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*(session.stop() for session in self.sessions))
+        self.sessions = []
+
+    async def _add_session(self) -> PooledSession:
+        self._numbers += 1
+        session = PooledSession(self._numbers, self.server_params, self._handle_message)
+        try:
+            await session.start(self.start_timeout)
+        except Exception:
+            await session.stop()
+            raise
+        self.sessions.append(session)
+        async with self._available:
+            self._available.notify_all()
+        return session
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _scale_up(self):
+        try:
+            await self._add_session()
+            self._start_failures = 0
+            logger.info(f"Scaled MCP server pool up to {len(self.sessions)} with {self.waiting} calls waiting")
+        except Exception as e:
+            # Back off so waiting callers do not respawn in a loop while the server cannot start
+            self._start_failures += 1
+            backoff = min(self.start_backoff * 2 ** (self._start_failures - 1), self.max_start_backoff)
+            self._next_start = time.monotonic() + backoff
+            logger.error(f"Could not start another MCP server, next attempt in {backoff:.1f}s: {e}")
+        finally:
+            self._starting -= 1
+            async with self._available:
+                self._available.notify_all()
+
+    async def _remove_session(self, session: PooledSession):
+        if session in self.sessions:
+            self.sessions.remove(session)
+        await session.stop()
+
+    async def _replace(self, session: PooledSession):
+        """Swap a dead session for a new process"""
+        if session not in self.sessions:
+            return
+        # The replacement counts towards the pool size while it starts, so callers do not scale past it
+        self._starting += 1
+        try:
+            await self._remove_session(session)
+            self.respawns += 1
+            logger.warning(f"Respawning MCP server {session.number}: {session.last_error}")
+            await self._add_session()
+        except Exception as e:
+            logger.error(f"Could not respawn MCP server: {e}")
+        finally:
+            self._starting -= 1
+
+    async def _handle_message(self, message):
+        """Server notifications and requests arriving on any session"""
+        if isinstance(message, ServerNotification) and isinstance(message.root, ToolListChangedNotification):
+            logger.info("MCP server reported that its tools changed")
+            if self.on_tools_changed is not None:
+                self.on_tools_changed()
+
+    def _pick(self, exclude=()) -> Optional[PooledSession]:
+        candidates = [
+            s for s in self.sessions
+            if s.healthy and s not in exclude and s.in_flight < self.session_concurrency
+        ]
+        return min(candidates, key=lambda s: s.in_flight) if candidates else None
+
+    async def _acquire(self, exclude=()) -> PooledSession:
+        async with self._available:
+            self.waiting += 1
+            try:
+                while True:
+                    session = self._pick(exclude)
+                    if session is not None:
+                        session.in_flight += 1
+                        return session
+                    # Every session is busy (or dead): grow the pool while there is room
+                    size = len(self.sessions) + self._starting
+                    if size < self.max_size and (self.waiting >= self.scale_up_queue_depth or size < self.min_size):
+                        backoff = self._next_start - time.monotonic()
+                        if backoff <= 0:
+                            # Counted now so the other waiters do not start one each
+                            self._starting += 1
+                            self._spawn(self._scale_up())
+                        else:
+                            # Wake up to try again once the backoff is over, unless a session frees up first
+                            try:
+                                await asyncio.wait_for(self._available.wait(), timeout=backoff)
+                            except asyncio.TimeoutError:
+                                pass
+                            continue
+                    await self._available.wait()
+            finally:
+                self.waiting -= 1
+
+    async def _release(self, session: PooledSession):
+        session.in_flight -= 1
+        session.last_used = time.monotonic()
+        async with self._available:
+            self._available.notify_all()
+
+    async def call_tool(self, name: str, arguments: Dict[str, Any], read_timeout_seconds: Optional[timedelta] = None):
+        tried = []
+        while True:
+            session = await self._acquire(exclude=tried)
+            tried.append(session)
+            try:
+                session.calls += 1
+                return await session.request("call_tool", name, arguments, read_timeout_seconds=read_timeout_seconds)
+            except Exception as e:
+                if not is_connection_error(e) or len(tried) > 1:
+                    raise
+                # The server process is gone; replace it and try the call once more elsewhere
+                session.healthy = False
+                session.last_error = str(e) or type(e).__name__
+                self._spawn(self._replace(session))
+            finally:
+                await self._release(session)
+
+    async def list_tools(self):
+        session = await self._acquire()
+        try:
+            return await session.request("list_tools")
+        finally:
+            await self._release(session)
+
+    async def check(self, session: PooledSession):
+        try:
+            await asyncio.wait_for(session.request("send_ping"), timeout=5)
+            session.healthy = True
+        except Exception as e:
+            session.healthy = False
+            session.last_error = str(e) or type(e).__name__
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            try:
+                live = [s for s in self.sessions if s.session is not None]
+                await asyncio.gather(*(self.check(s) for s in live))
+                for session in [s for s in self.sessions if not s.healthy]:
+                    await self._replace(session)
+                # Stop sessions that have been idle for a while, keeping at least min_size
+                now = time.monotonic()
+                for session in list(self.sessions):
+                    if len(self.sessions) <= self.min_size:
+                        break
+                    if session.in_flight == 0 and now - session.last_used > self.idle_timeout:
+                        await self._remove_session(session)
+                        logger.info(f"Scaled MCP server pool down to {len(self.sessions)}")
+                while len(self.sessions) + self._starting < self.min_size:
+                    await self._add_session()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"MCP server health check failed: {e}")
+
+    def status(self) -> dict:
+        return {
+            "size": len(self.sessions),
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "waiting": self.waiting,
+            "respawns": self.respawns,
+            "sessions": [session.status() for session in self.sessions],
+        }
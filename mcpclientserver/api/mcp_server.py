@@ -1,16 +1,21 @@
 from mcp.server.fastmcp import FastMCP
+from mcp.server.fastmcp.exceptions import ToolError
+from mcp.types import ToolAnnotations
 from dotenv import load_dotenv
 import httpx
 import json
 import os
 import asyncio
 from bs4 import BeautifulSoup
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
 
 load_dotenv()
 
 mcp = FastMCP("docs")
 
+# Both tools only read public docs, so clients may cache their results
+READ_ONLY = ToolAnnotations(readOnlyHint=True, openWorldHint=True)
+
 USER_AGENT = "docs-app/1.0"
 SERPER_URL = "https://google.serper.dev/search"
 
@@ -37,10 +42,10 @@ async def search_web(query: str) -> dict:
             return response.json()
         except (httpx.TimeoutException, httpx.HTTPError) as e:
             print(f"Search error: {e}")
-            return {"organic": []}
+            return {"organic": [], "error": str(e) or type(e).__name__}
 
-async def fetch_url_safe(url: str, max_chars: int = 10000) -> str:
-    """Fetch URL with better error handling and content limiting"""
+async def fetch_url_safe(url: str, max_chars: int = 10000) -> Tuple[str, bool]:
+    """Fetch URL with better error handling and content limiting; returns (text, fetched)"""
     async with httpx.AsyncClient() as client:
         try:
             response = await client.get(
@@ -64,13 +69,13 @@ async def fetch_url_safe(url: str, max_chars: int = 10000) -> str:
             if len(text) > max_chars:
                 text = text[:max_chars] + "\n\n[Content truncated...]"
             
-            return f"URL: {url}\nContent:\n{text}\n{'-'*50}\n"
+            return f"URL: {url}\nContent:\n{text}\n{'-'*50}\n", True
             
         except Exception as e:
-            return f"URL: {url}\nError: Failed to fetch - {str(e)}\n{'-'*50}\n"
+            return f"URL: {url}\nError: Failed to fetch - {str(e)}\n{'-'*50}\n", False
 
-async def fetch_urls_concurrent(urls: List[str], max_chars: int = 10000) -> str:
-    """Fetch multiple URLs concurrently with timeout protection"""
+async def fetch_urls_concurrent(urls: List[str], max_chars: int = 10000) -> Tuple[str, int]:
+    """Fetch multiple URLs concurrently with timeout protection; returns (text, pages fetched)"""
     try:
         # Use asyncio.wait_for to add an overall timeout
         tasks = [fetch_url_safe(url, max_chars) for url in urls]
@@ -81,18 +86,20 @@ async def fetch_urls_concurrent(urls: List[str], max_chars: int = 10000) -> str:
         
         # Combine results
         combined_text = ""
+        fetched = 0
         for result in results:
-            if isinstance(result, str):
-                combined_text += result
+            if isinstance(result, tuple):
+                combined_text += result[0]
+                fetched += result[1]
             else:
                 combined_text += f"Error processing URL: {str(result)}\n{'-'*50}\n"
         
-        return combined_text
+        return combined_text, fetched
         
     except asyncio.TimeoutError:
-        return "Error: Request timed out while fetching documentation pages"
+        return "Error: Request timed out while fetching documentation pages", 0
 
-@mcp.tool()  
+@mcp.tool(annotations=READ_ONLY)
 async def get_docs(query: str, library: str):
     """
     Search the latest docs for a given query and library.
@@ -114,6 +121,9 @@ async def get_docs(query: str, library: str):
     
     results = await search_web(search_query)
     
+    # Raised so the result is marked as an error and not cached by clients
+    if results.get("error"):
+        raise ToolError(f"Search failed: {results['error']}")
     if not results.get("organic"):
         return f"No results found for '{query}' in {library} documentation"
     
@@ -122,14 +132,15 @@ async def get_docs(query: str, library: str):
     print(f"Found {len(urls)} URLs to fetch")
     
     # Fetch content concurrently
-    content = await fetch_urls_concurrent(urls, max_chars=5000)  # Reduced max chars
+    content, fetched = await fetch_urls_concurrent(urls, max_chars=5000)  # Reduced max chars
     
-    if not content.strip():
-        return f"Found {len(urls)} results but could not fetch content"
+    # Raised so a transient outage is marked as an error and not cached by clients
+    if not fetched:
+        raise ToolError(f"Found {len(urls)} results but could not fetch content:\n{content}")
     
     return content
 
-@mcp.tool()
+@mcp.tool(annotations=READ_ONLY)
 async def search_docs_only(query: str, library: str):
     """
     Just search for docs URLs without fetching content (faster).
@@ -147,6 +158,8 @@ async def search_docs_only(query: str, library: str):
     search_query = f"site:{docs_urls[library]} {query}"
     results = await search_web(search_query)
     
+    if results.get("error"):
+        raise ToolError(f"Search failed: {results['error']}")
     if not results.get("organic"):
         return f"No results found for '{query}' in {library} documentation"
     
@@ -0,0 +1,64 @@
+"""Stand-in for mcp_server.py with the same tools, answering after a fixed delay without
+calling Serper or fetching pages. Used by the benchmarks.
+
+STUB_CRASH_AFTER=n makes the process exit in the middle of its n-th get_docs call, to
+exercise crash recovery.
+
+    STUB_TOOL_LATENCY=0.5 python stub_mcp_server.py
+"""
+from mcp.server.fastmcp import FastMCP
+from mcp.types import ToolAnnotations
+import asyncio
+import os
+
+mcp = FastMCP("docs")
+
+# Both tools only read public docs, so clients may cache their results
+READ_ONLY = ToolAnnotations(readOnlyHint=True, openWorldHint=True)
+
+TOOL_LATENCY = float(os.getenv("STUB_TOOL_LATENCY", "0.5"))
+CRASH_AFTER = int(os.getenv("STUB_CRASH_AFTER", "0"))
+
+calls = 0
+
+
+@mcp.tool(annotations=READ_ONLY)
+async def get_docs(query: str, library: str):
+    """
+    Search the latest docs for a given query and library.
+    Supports langchain, openai, and llama-index.
+
+    Args:
+        query: The query to search for (e.g. "Chroma DB")
+        library: The library to search in (e.g. "langchain")
+
+    Returns:
+        Text from the docs (limited to prevent timeouts)
+    """
+    global calls
+    calls += 1
+    if calls == CRASH_AFTER:
+        await asyncio.sleep(TOOL_LATENCY / 2)
+        os._exit(1)
+    await asyncio.sleep(TOOL_LATENCY)
+    return f"Docs for '{query}' in {library}: stand-in page content."
+
+
+@mcp.tool(annotations=READ_ONLY)
+async def search_docs_only(query: str, library: str):
+    """
+    Just search for docs URLs without fetching content (faster).
+
+    Args:
+        query: The query to search for
+        library: The library to search in
+
+    Returns:
+        Search results with titles and URLs
+    """
+    await asyncio.sleep(TOOL_LATENCY / 5)
+    return f"Found 1 results for '{query}' in {library}:\n\n1. Stand-in result\n   URL: https://example.com\n"
+
+
+if __name__ == "__main__":
+    mcp.run(transport="stdio")
@@ -0,0 +1,117 @@
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from collections import OrderedDict
+import asyncio
+import json
+import time
+
+from mcp.types import CallToolResult, Tool
+
+
+def cache_key(name: str, arguments: Dict[str, Any]) -> str:
+    """Tool name plus its arguments in canonical form: sorted keys, compact, strings trimmed"""
+    def canonical(value):
+        if isinstance(value, dict):
+            return {key: canonical(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [canonical(item) for item in value]
+        if isinstance(value, str):
+            return value.strip()
+        return value
+
+    return name + ":" + json.dumps(canonical(arguments or {}), sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+
+class ToolResultCache:
+    """LRU cache of tool results with a TTL per tool.
+
+    A tool is cached when it declares itself read-only (the `readOnlyHint` tool annotation)
+    for `default_ttl` seconds, unless `ttls` says otherwise: a positive TTL turns caching on
+    for that tool, 0 turns it off. Error results are never stored, and concurrent calls
+    with the same key share one server call.
+    """
+
+    def __init__(self, max_entries: int = 1024, default_ttl: float = 600.0, ttls: Optional[Dict[str, float]] = None):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.ttls = ttls or {}
+        self._entries: "OrderedDict[str, Tuple[float, CallToolResult]]" = OrderedDict()
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+        self.evictions = 0
+        self.per_tool: Dict[str, Dict[str, int]] = {}
+
+    def ttl_for(self, tool: Optional[Tool], name: str) -> float:
+        """Seconds to keep results of this tool, 0 when it is not cacheable"""
+        if name in self.ttls:
+            return self.ttls[name]
+        annotations = tool.annotations if tool is not None else None
+        return self.default_ttl if annotations is not None and annotations.readOnlyHint else 0
+
+    def _count(self, name: str, outcome: str):
+        counts = self.per_tool.setdefault(name, {"hits": 0, "misses": 0})
+        counts[outcome] += 1
+
+    def get(self, key: str) -> Optional[CallToolResult]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def set(self, key: str, result: CallToolResult, ttl: float):
+        self._entries[key] = (time.monotonic() + ttl, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get_or_call(
+        self, name: str, arguments: Dict[str, Any], ttl: float, call: Callable[[], Awaitable[CallToolResult]]
+    ) -> Tuple[CallToolResult, bool]:
+        """The cached result, or the result of `call()`; the flag says whether it came from the cache"""
+        key = cache_key(name, arguments)
+        result = self.get(key)
+        if result is not None:
+            self.hits += 1
+            self._count(name, "hits")
+            return result, True
+
+        task = self._in_flight.get(key)
+        if task is None:
+            self.misses += 1
+            self._count(name, "misses")
+            task = self._in_flight[key] = asyncio.ensure_future(self._call(key, ttl, call))
+            # Every caller may have given up by the time it fails; mark the exception as seen
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        else:
+            # Joins a call already under way: neither a hit nor a server call of its own
+            self.shared += 1
+        # Shield the shared call so one cancelled caller does not cancel it for the others
+        return await asyncio.shield(task), False
+
+    async def _call(self, key: str, ttl: float, call: Callable[[], Awaitable[CallToolResult]]) -> CallToolResult:
+        try:
+            result = await call()
+            if not result.isError:
+                self.set(key, result, ttl)
+            return result
+        finally:
+            self._in_flight.pop(key, None)
+
+    def stats(self) -> dict:
+        # Callers that shared an in-flight call are left out of the hit rate
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "shared_in_flight": self.shared,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "per_tool": self.per_tool,
+        }
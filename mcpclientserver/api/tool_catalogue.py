@@ -0,0 +1,100 @@
+from typing import Awaitable, Callable, Dict, List, Optional
+import asyncio
+import hashlib
+import json
+import time
+
+from mcp.types import Tool
+from utils.logger import logger
+
+
+class ToolCatalogue:
+    """The MCP server's tools, kept in memory.
+
+    The Anthropic tool definitions and an ETag are computed once per refresh. The
+    catalogue is refreshed in the background when the server reports that its tools
+    changed, or when it is older than `ttl` seconds; until then the current copy is
+    served, so neither model calls nor /tools wait on the server. After a failed refresh,
+    the TTL only triggers another one `retry_interval` seconds later.
+    """
+
+    def __init__(self, list_tools: Callable[[], Awaitable[List[Tool]]], ttl: float = 300.0, retry_interval: float = 30.0):
+        self.list_tools = list_tools
+        self.ttl = ttl
+        self.retry_interval = retry_interval
+        self.tools: List[Tool] = []
+        self.by_name: Dict[str, Tool] = {}
+        self.definitions: List[dict] = []
+        # The same with a prompt cache breakpoint after the last tool, which caches them all
+        self.cached_definitions: List[dict] = []
+        self.etag: Optional[str] = None
+        self.refreshed_at = 0.0
+        self.refreshes = 0
+        self.failures = 0
+        self.failed_at: Optional[float] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+        # Set when a change is reported while a refresh is already running
+        self._dirty = False
+
+    async def refresh(self):
+        tools = await self.list_tools()
+        definitions = [
+            {
+                "name": tool.name,
+                "description": tool.description,
+                "input_schema": tool.inputSchema,
+            }
+            for tool in tools
+        ]
+        digest = hashlib.sha256(json.dumps(definitions, sort_keys=True).encode()).hexdigest()
+        self.tools, self.definitions, self.etag = tools, definitions, f'"{digest[:16]}"'
+        self.by_name = {tool.name: tool for tool in tools}
+        self.cached_definitions = definitions[:-1] + [
+            {**definition, "cache_control": {"type": "ephemeral"}} for definition in definitions[-1:]
+        ]
+        self.refreshed_at = time.monotonic()
+        self.failed_at = None
+        self.refreshes += 1
+        logger.info(f"Tool catalogue refreshed: {[tool['name'] for tool in definitions]}")
+
+    def invalidate(self):
+        """Refresh in the background, e.g. on a tools/list_changed notification"""
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._background_refresh())
+        else:
+            # The running refresh may already have listed the old tools; go again after it
+            self._dirty = True
+
+    async def _background_refresh(self):
+        while True:
+            self._dirty = False
+            try:
+                await self.refresh()
+            except Exception as e:
+                self.failures += 1
+                self.failed_at = time.monotonic()
+                logger.error(f"Error refreshing tool catalogue: {e}")
+            if not self._dirty:
+                return
+
+    def current(self) -> List[dict]:
+        """Anthropic tool definitions, scheduling a refresh when they are past their TTL"""
+        now = time.monotonic()
+        # Without the retry interval every call would start another round trip while the server fails
+        retry_due = self.failed_at is None or now - self.failed_at > self.retry_interval
+        if now - self.refreshed_at > self.ttl and retry_due:
+            self.invalidate()
+        return self.definitions
+
+    def to_dict(self) -> dict:
+        self.current()
+        return {"tools": self.definitions}
+
+    def status(self) -> dict:
+        return {
+            "tools": len(self.definitions),
+            "etag": self.etag,
+            "age_seconds": round(time.monotonic() - self.refreshed_at, 1),
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+        }